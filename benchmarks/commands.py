@@ -0,0 +1,143 @@
+"""
+Command parsing throughput of the two-pass parser with linear lookups against the precompiled single-pass parser.
+
+Every message is parsed by both and the results (or raised errors) are compared before timing.
+
+Usage: python -m benchmarks.commands [messages]
+"""
+import sys, time, random
+from src.commands import Command
+from src.lib.command import CommandMessage
+from src.lib.exceptions import *
+
+
+def legacy_from_name(command_name: str) -> Command:
+    name, args = "UNKNOWN", Command.__members__["UNKNOWN"]
+    for key, value in Command.__members__.items():
+        if command_name.casefold() == key.casefold():
+            name, args = key, value
+    return Command(name, *args)
+
+
+def legacy_opt_chars(command: Command) -> list:
+    return [opt["character"] for opt in command.opts]
+
+
+def legacy_opt_field(command: Command, character: str, field: str):
+    for opt in command.opts:
+        if opt["character"] == character:
+            return opt[field]
+    return None
+
+
+def legacy_is_argument(i: int, arg: str, segments: list, command: Command, arg_index: int) -> bool:
+    return (
+        not arg.startswith("-")
+        and (
+            i == 0
+            or (i != 0 and not segments[i - 1].startswith("-"))
+            or (segments[i - 1].startswith("-") and segments[i - 1][1:] not in legacy_opt_chars(command))
+            or (segments[i - 1].startswith("-") and segments[i - 1][1:] in legacy_opt_chars(command) and legacy_opt_field(command, segments[i - 1][1:], "type") is bool)
+        )
+        and arg_index < len(command.args)
+    )
+
+
+def legacy_argument_parser(segments: list, command: Command):
+    if not command.args:
+        return
+    arg_index = 0
+    for i, arg in enumerate(segments):
+        if legacy_is_argument(i, arg, segments, command, arg_index):
+            argument_name = command.get_arg_name(arg_index)
+            argument_type = command.get_arg_type(arg_index)
+            is_trailing = command.args[arg_index]["trailing"]
+            try:
+                arg_index += 1
+                value = argument_type(arg) if not is_trailing else argument_type(" ".join(segments[i:]))
+                yield argument_name, value
+            except ValueError:
+                raise ArgumentValueError(arg, argument_type)
+
+
+def legacy_options_parser(segments: list, command: Command):
+    if not command.opts:
+        return
+    arg_index = 0
+    opt_index = 0
+    trailing_index = None
+    for i, arg in enumerate(segments):
+        is_option = arg.startswith("-") and len(arg) > 1 and arg[1:] in legacy_opt_chars(command) and opt_index < len(command.opts)
+        if is_option and not (trailing_index is not None and i > trailing_index):
+            character = arg[1:]
+            option_name = legacy_opt_field(command, character, "name")
+            option_type = legacy_opt_field(command, character, "type")
+            if option_type is not bool:
+                if i + 1 < len(segments) and not segments[i + 1].startswith("-"):
+                    value = option_type(segments[i + 1])
+                else:
+                    raise OptionMissingError(option_name)
+            else:
+                value = True
+            opt_index += 1
+            yield option_name, value
+        elif legacy_is_argument(i, arg, segments, command, arg_index):
+            if command.args[arg_index]["trailing"]:
+                trailing_index = i
+            arg_index += 1
+
+
+def legacy_deserialize(message: str) -> CommandMessage:
+    segments = message[1:].split()
+    command = legacy_from_name(segments.pop(0))
+    args = {key: value for key, value in legacy_argument_parser(segments, command)}
+    opts = {key: value for key, value in legacy_options_parser(segments, command)}
+    return CommandMessage(command, args, opts)
+
+
+def make_messages(count: int) -> list[str]:
+    names = [member.name for member in Command.get_commands()] + ["nope"]
+    words = ["hello", "world", "-u", "-l", "-o", "out.mid", "-x", "-", "https://example.com/song.mid", "Rush", "E"]
+    messages = []
+    for _ in range(count):
+        name = random.choice(names)
+        name = name.upper() if random.random() < 0.2 else name
+        messages.append("!" + " ".join([name] + random.choices(words, k=random.randint(0, 6))))
+    return messages
+
+
+def outcome(parse, message: str):
+    try:
+        parsed = parse(message)
+        return str(parsed.type), parsed.args, parsed.opts
+    except Exception as e:
+        return type(e), str(e)
+
+
+def run(parse, messages: list[str]):
+    for message in messages:
+        try:
+            parse(message)
+        except Exception:
+            pass
+
+
+def measure(label: str, parse, messages: list[str]) -> float:
+    start = time.perf_counter()
+    run(parse, messages)
+    rate = len(messages) / (time.perf_counter() - start)
+    print(f"{label:<10} {rate:>12,.0f} messages/s")
+    return rate
+
+
+def main(count: int = 100000):
+    messages = make_messages(count)
+    mismatches = [message for message in messages[:20000] if outcome(legacy_deserialize, message) != outcome(CommandMessage.deserialize, message)]
+    print(f"mismatches {len(mismatches):>12}" + (f" (first: {mismatches[0]!r})" if mismatches else ""))
+    before = measure("legacy", legacy_deserialize, messages)
+    after = measure("compiled", CommandMessage.deserialize, messages)
+    print(f"speedup    {after / before:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,90 @@
+"""
+Inbound decode and dispatch throughput, before and after the precomputed dispatch table, and with mouse traffic skipped.
+
+Usage: python -m benchmarks.dispatch [frames]
+"""
+import json, sys, time, random
+from src.lib.message import MPPMessage
+from src.lib.dispatch import DispatchTable
+
+
+class Handlers:
+    async def handle_m_message(self, message: MPPMessage):
+        pass
+
+    async def handle_n_message(self, message: MPPMessage):
+        pass
+
+    async def handle_a_message(self, message: MPPMessage):
+        pass
+
+
+def make_frames(count: int) -> list[str]:
+    frames = []
+    for i in range(count):
+        client_id = "{:024x}".format(random.getrandbits(96))
+        if i % 10 == 0:
+            frame = [{"m": "a", "id": str(i), "t": i, "a": "hello", "p": {"_id": client_id, "name": "user"}}]
+        elif i % 3 == 0:
+            frame = [{"m": "n", "t": i, "p": client_id, "n": [{"n": "c3", "v": 0.5}, {"n": "e3", "d": 10, "v": 0.5}]}]
+        else:
+            frame = [{"m": "m", "id": client_id, "x": "50.00", "y": "50.00"}]
+        frames.append(json.dumps(frame, separators=(",", ":")))
+    return frames
+
+
+def legacy_deserialize(data: str) -> list[MPPMessage]:
+    messages = []
+    for json_msg in json.loads(data):
+        try:
+            m = json_msg.pop("m")
+            message_type = None
+            for member in MPPMessage.ClientBound:
+                if member.value[0] == m:
+                    message_type = member
+                    break
+            if message_type is None:
+                raise ValueError(f"No such message type '{m}'")
+        except (KeyError, ValueError):
+            message_type = MPPMessage.ClientBound.UNKNOWN
+        messages.append(MPPMessage(message_type, **json_msg))
+    return messages
+
+
+def run_legacy(frames: list[str], handlers: Handlers):
+    for frame in frames:
+        for message in legacy_deserialize(frame):
+            handler = getattr(handlers, f"handle_{message.type.m}_message", None)
+            if handler is not None:
+                handler(message).close()
+
+
+def run_table(frames: list[str], handlers: dict, accept: frozenset = None):
+    for frame in frames:
+        for message in MPPMessage.deserialize(frame, accept):
+            handler = handlers.get(message.type.m)
+            if handler is not None:
+                handler(message).close()
+
+
+def measure(label: str, function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    rate = len(args[0]) / elapsed
+    print(f"{label:<10} {rate:>12,.0f} messages/s")
+    return rate
+
+
+def main(count: int = 200000):
+    frames = make_frames(count)
+    handlers = Handlers()
+    before = measure("legacy", run_legacy, frames, handlers)
+    bound = DispatchTable.build(Handlers).bind(handlers)
+    after = measure("table", run_table, frames, bound)
+    skipped = measure("skip m", run_table, frames, bound, frozenset({"a", "n"}))
+    print(f"speedup    {after / before:>12.2f}x (table), {skipped / before:.2f}x (skip m)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -44,3 +44,169 @@ class Config:
     def max_retry_delay(self) -> int:
         MAX_DELAY = 120
         return MAX_DELAY
+
+    @property
+    def playback_lead_in(self) -> int:
+        LEAD_IN = 1000
+        return LEAD_IN
+
+    @property
+    def playback_window(self) -> int:
+        WINDOW = 200
+        return WINDOW
+
+    @property
+    def scoring_window(self) -> int:
+        WINDOW = 150
+        return WINDOW
+
+    @property
+    def skip_unhandled_messages(self) -> bool:
+        SKIP_UNHANDLED = True
+        return SKIP_UNHANDLED
+
+    @property
+    def track_cursors(self) -> bool:
+        TRACK_CURSORS = False
+        return TRACK_CURSORS
+
+    @property
+    def write_behind(self) -> bool:
+        WRITE_BEHIND = True
+        return WRITE_BEHIND
+
+    @property
+    def write_behind_batch_size(self) -> int:
+        BATCH_SIZE = 100
+        return BATCH_SIZE
+
+    @property
+    def write_behind_interval(self) -> float:
+        INTERVAL = 1.0
+        return INTERVAL
+
+    @property
+    def database_readers(self) -> int:
+        READERS = 4
+        return READERS
+
+    @property
+    def user_cache_size(self) -> int:
+        SIZE = 1024
+        return SIZE
+
+    @property
+    def search_results(self) -> int:
+        RESULTS = 10
+        return RESULTS
+
+    @property
+    def search_similarity_threshold(self) -> float:
+        THRESHOLD = 0.45
+        return THRESHOLD
+
+    @property
+    def log_capture(self) -> int:
+        from src.lib import Debug
+        CAPTURE = Debug.CONNECTION.value | Debug.DATABASE.value | Debug.PLAYBACK.value
+        return CAPTURE
+
+    @property
+    def log_buffer_size(self) -> int:
+        SIZE = 1024
+        return SIZE
+
+    @property
+    def structured_logs(self) -> bool:
+        STRUCTURED = False
+        return STRUCTURED
+
+    @property
+    def metrics_host(self) -> str:
+        HOST = "127.0.0.1"
+        return HOST
+
+    @property
+    def metrics_port(self) -> int:
+        PORT = 9464  # 0 disables the endpoint
+        return PORT
+
+    @property
+    def inbound_queue_size(self) -> int:
+        SIZE = 1024  # messages
+        return SIZE
+
+    @property
+    def outbound_queue_size(self) -> int:
+        SIZE = 256  # messages
+        return SIZE
+
+    @property
+    def queue_note_limit(self) -> int:
+        LIMIT = 256  # most notes a queued NOTES message grows to when batching
+        return LIMIT
+
+    @property
+    def handler_concurrency(self) -> int:
+        CONCURRENCY = 8
+        return CONCURRENCY
+
+    @property
+    def handler_timeout(self) -> float:
+        TIMEOUT = 120.0  # seconds; must cover a download (download_timeout) and parsing it
+        return TIMEOUT
+
+    @property
+    def handler_max_pending(self) -> int:
+        MAX_PENDING = 256
+        return MAX_PENDING
+
+    @property
+    def idle_tps(self) -> float:
+        TPS = 2.0
+        return TPS
+
+    @property
+    def playback_tps(self) -> float:
+        TPS = 10.0
+        return TPS
+
+    @property
+    def tick_budget(self) -> float:
+        BUDGET = 0.02
+        return BUDGET
+
+    @property
+    def midi_max_tracks(self) -> int:
+        MAX_TRACKS = 256
+        return MAX_TRACKS
+
+    @property
+    def midi_max_events(self) -> int:
+        MAX_EVENTS = 500000
+        return MAX_EVENTS
+
+    @property
+    def midi_max_duration(self) -> int:
+        MAX_DURATION = 30 * 60 * 1000  # milliseconds
+        return MAX_DURATION
+
+    @property
+    def midi_max_density(self) -> int:
+        MAX_DENSITY = 1000  # note presses within any one second
+        return MAX_DENSITY
+
+    @property
+    def download_max_size(self) -> int:
+        MAX_SIZE = 4 * 1024 * 1024
+        return MAX_SIZE
+
+    @property
+    def download_timeout(self) -> float:
+        TIMEOUT = 30.0
+        return TIMEOUT
+
+    @property
+    def download_concurrency(self) -> int:
+        CONCURRENCY = 2
+        return CONCURRENCY
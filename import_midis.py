@@ -0,0 +1,161 @@
+"""
+Bulk import of MIDI files into an instance's MIDI library.
+
+Walks a directory, or a .zip/.tar archive, and parses and validates the MIDIs on a process pool, where each worker
+writes the files and their event caches straight into the content-addressed store. Files whose contents are already in
+the library, or that repeat another file of the import, are skipped, and the new ``midis`` rows are inserted in a
+single transaction.
+
+Usage: python import_midis.py <directory|archive> [--instance NAME] [--workers N]
+"""
+import argparse, os, tarfile, time, zipfile
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from src.crud import DatabaseManager
+from src.lib import Debug, MidiLimits, MidiStore
+from src.lib.exceptions import MidiParseError
+from config import Config
+
+config = Config()
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+# Jobs submitted per worker ahead of the results being consumed; bounds the tar member data held in memory
+JOBS_PER_WORKER = 8
+
+
+def find_midis(source: str, max_size: int) -> Iterator[Tuple[str, str, Optional[str], Optional[bytes], Optional[str]]]:
+    """
+    Yield ``(name, path, member, data, rejection)`` for every MIDI in a directory or archive.
+
+    Files on disk and zip members are read by the workers themselves; tar archives can only be read front to back, so
+    their members are read here and handed over as ``data``, unless they are larger than ``max_size`` and are yielded
+    with the ``rejection`` reason instead.
+    """
+    if os.path.isdir(source):
+        for directory, _, filenames in os.walk(source):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(MIDI_EXTENSIONS):
+                    yield filename, os.path.join(directory, filename), None, None, None
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(MIDI_EXTENSIONS):
+                    yield os.path.basename(info.filename), source, info.filename, None, None
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for info in archive:
+                if not info.isfile() or not info.name.lower().endswith(MIDI_EXTENSIONS):
+                    continue
+                if info.size > max_size:
+                    yield os.path.basename(info.name), source, None, None, f"larger than {max_size} bytes"
+                else:
+                    yield os.path.basename(info.name), source, None, archive.extractfile(info).read(), None
+    else:
+        raise ValueError(f"'{source}' is neither a directory nor a zip or tar archive")
+
+
+def import_midi(job: Tuple[str, str, Optional[str], Optional[bytes], Optional[str], MidiStore, int]) -> Tuple[str, Optional[str], Optional[str]]:
+    """Worker: read, validate and store one MIDI; returns ``(name, sha256, None)`` or ``(name, None, reason)``."""
+    name, path, member, data, rejection, store, max_size = job
+    if rejection is not None:
+        return name, None, rejection
+    try:
+        if data is None and member is not None:
+            with zipfile.ZipFile(path) as archive:
+                if archive.getinfo(member).file_size > max_size:
+                    return name, None, f"larger than {max_size} bytes"
+                data = archive.read(member)
+        elif data is None:
+            if os.path.getsize(path) > max_size:
+                return name, None, f"larger than {max_size} bytes"
+            with open(path, "rb") as file:
+                data = file.read()
+        if len(data) > max_size:
+            return name, None, f"larger than {max_size} bytes"
+        return name, store.add_bytes(data), None
+    except MidiParseError as e:
+        return name, None, e.reason
+    except (OSError, zipfile.BadZipFile) as e:
+        return name, None, str(e)
+
+
+def map_bounded(executor: Executor, function: Callable, jobs: Iterable, window: int) -> Iterator:
+    """
+    Like ``executor.map``, but keeps only ``window`` jobs in flight.
+
+    ``Executor.map`` submits every job before returning its first result, which would read a whole tar archive into
+    memory; here ``jobs`` is consumed only as results are taken, still in submission order.
+    """
+    in_flight = deque()
+    for job in jobs:
+        in_flight.append(executor.submit(function, job))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def main(source: str, instance_name: str, workers: Optional[int]):
+    level = os.getenv("DEBUG_LEVEL") or "none"
+    limits = MidiLimits(config.midi_max_tracks, config.midi_max_events, config.midi_max_duration, config.midi_max_density)
+    store = MidiStore(os.path.abspath("instance/midis"), limits)
+    db = DatabaseManager(instance_name, int(level) if level.isdigit() else Debug.from_string(level))
+    try:
+        existing_names = set(db.get_midi_filenames())
+        existing_hashes = {row[0] for row in db.fetch_all("SELECT sha256 FROM midis WHERE sha256 IS NOT NULL")}
+        rows, names, hashes, unreferenced = [], set(), set(), set()
+        scanned = duplicates = conflicts = 0
+        invalid = []
+
+        started = time.perf_counter()
+        jobs = ((*found, store, config.download_max_size) for found in find_midis(source, config.download_max_size))
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as executor:
+            for name, sha256, reason in map_bounded(executor, import_midi, jobs, workers * JOBS_PER_WORKER):
+                scanned += 1
+                if sha256 is None:
+                    invalid.append((name, reason))
+                elif sha256 in existing_hashes or sha256 in hashes:
+                    duplicates += 1
+                elif name in existing_names or name in names:
+                    conflicts += 1
+                    unreferenced.add(sha256)
+                else:
+                    names.add(name)
+                    hashes.add(sha256)
+                    rows.append({"filename": name, "sha256": sha256})
+        parsed = time.perf_counter()
+
+        with db.transaction():
+            for row in rows:
+                db.add_midi(row)
+        finished = time.perf_counter()
+    finally:
+        db.close()
+
+    # The workers already stored the files that were then rejected as name conflicts
+    for sha256 in unreferenced - hashes - existing_hashes:
+        store.remove(sha256)
+
+    for name, reason in invalid[:20]:
+        print(f"  skipped {name}: {reason}")
+    if len(invalid) > 20:
+        print(f"  ... and {len(invalid) - 20} more invalid file(s)")
+    elapsed = finished - started
+    print(f"Imported {len(rows)} of {scanned} file(s) in {elapsed:.2f}s ({scanned / elapsed if elapsed else 0:.0f} files/s)")
+    print(f"  {duplicates} duplicate(s), {conflicts} name conflict(s), {len(invalid)} invalid")
+    print(f"  parse and store: {parsed - started:.2f}s, database insert: {finished - parsed:.2f}s")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Import a directory or archive of MIDI files into the MIDI library")
+    parser.add_argument("source", help="directory, .zip or .tar archive to import")
+    parser.add_argument("--instance", default=os.getenv("INSTANCE"), help="instance (database) name, defaults to $INSTANCE")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+    if not args.instance:
+        parser.error("no instance name given and $INSTANCE is not set")
+    main(args.source, args.instance, args.workers)
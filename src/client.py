@@ -1,7 +1,9 @@
-import asyncio, websockets, json, time, requests, os
-from typing import List, Optional, Dict
+import asyncio, websockets, json, time, os, functools
+from typing import List, Optional, Dict, Tuple, Hashable
 from src.crud import DatabaseManager
-from src.lib import MPPMessage, Logger, Participant, CommandMessage, Debug
+from src.roles import Role
+from src.lib import MPPMessage, Logger, LogSink, Metrics, MetricsServer, Scheduler, ScheduledTask, Downloader, MidiLimits, MidiStore, Participant, ParticipantStore, CommandMessage, Debug, MidiPlayer, NoteQuota, TimeSync, ScoringEngine, MessageQueue, QueuePolicy, DispatchTable, ConcurrentDispatcher, HandlerJob, noop
+from src.lib import ChatMessage, DirectMessage, VerifyMessage, DisconnectMessage, ChatHistoryMessage, ChannelInfoMessage, CustomMessage, ConnectMessage, RoomListMessage, MouseMessage, NotesMessage, NotificationMessage, NoteQuotaMessage, ParticipantMessage, PongMessage, UnknownMessage
 from src.utils import sqliteutils, regex
 from src.lib.exceptions import *
 from config import Config
@@ -10,6 +12,16 @@ config = Config()
 
 
 class MPPClient:
+    dispatch_table: DispatchTable
+
+    # Lane shared by every message that changes who is in the channel, so joins, leaves and snapshots apply in order
+    MEMBERSHIP_LANE = "membership"
+    MEMBERSHIP_TYPES = frozenset(member.m for member in (MPPMessage.ClientBound.CHANNELINFO, MPPMessage.ClientBound.PARTICIPANTADDED, MPPMessage.ClientBound.DISCONNECT))
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch_table = DispatchTable.build(cls)
+
     def __init__(self, token: str, name: str, color: str, channel: str, instance_name: str, prefix: str, debug: str, host: str = "mppclone.com", port: int = 443):
         self.token = token
         self.name = name
@@ -23,66 +35,161 @@ class MPPClient:
 
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
         self.db: Optional[DatabaseManager] = None
-        self.inbound_queue = asyncio.Queue()
-        self.outbound_queue = asyncio.Queue()
-        self.logger = Logger(self.__class__.__name__, self.debug)
-
+        self.logger = Logger(self.__class__.__name__, self.debug, config.log_capture, LogSink.default(capacity=config.log_buffer_size, structured=config.structured_logs))
+        self.message_handlers = self.dispatch_table.bind(self)
+        self.dispatcher = ConcurrentDispatcher(config.handler_concurrency, config.handler_timeout, config.handler_max_pending, self.handle_dispatch_error)
+        self.decoded_types = self.dispatch_table.active(type(self)) if config.skip_unhandled_messages else None
+        # With the base MOUSE handler, a batch of cursor moves is applied in one update_cursors call
+        self.batch_cursors = self.dispatch_table.resolve(type(self), MPPMessage.ClientBound.MOUSE.m) is MPPClient.handle_m_message
+        if self.decoded_types is not None and self.batch_cursors and not config.track_cursors:
+            # Cursor updates are the bulk of the traffic in a busy room; only decode them when positions are tracked or
+            # a subclass handles them itself
+            self.decoded_types -= {MPPMessage.ClientBound.MOUSE.m}
+
+        self.client_id: Optional[str] = None
         self.participants: Dict[str, Participant] = {}
+        self.positions = ParticipantStore()
+        self.player: Optional[MidiPlayer] = None
+        self.scoring: Optional[ScoringEngine] = None
+        self.note_quota = NoteQuota()
+        self.time_sync = TimeSync()
+        self.metrics = Metrics()
+        self.queue_merged = self.metrics.counter("mpp_queue_merged_total", "Queued messages replaced or merged by a newer one", ("queue", "type"))
+        self.queue_shed = self.metrics.counter("mpp_queue_shed_total", "Messages shed because a queue was full", ("queue", "type"))
+        inbound_policies = {MPPMessage.ClientBound.MOUSE.m: QueuePolicy.COALESCE, MPPMessage.ClientBound.NOTES.m: QueuePolicy.BATCH}
+        outbound_policies = {MPPMessage.ServerBound.MOUSE.m: QueuePolicy.COALESCE, MPPMessage.ServerBound.NOTES.m: QueuePolicy.BATCH, MPPMessage.ServerBound.PING.m: QueuePolicy.COALESCE}
+        self.inbound_queue = MessageQueue(config.inbound_queue_size, inbound_policies, note_limit=config.queue_note_limit, on_merge=functools.partial(self.queue_merged.inc, "inbound"), on_shed=functools.partial(self.queue_shed.inc, "inbound"))
+        self.outbound_queue = MessageQueue(config.outbound_queue_size, outbound_policies, note_limit=config.queue_note_limit, on_merge=functools.partial(self.queue_merged.inc, "outbound"), on_shed=functools.partial(self.queue_shed.inc, "outbound"))
+        self.handler_latency = self.metrics.histogram("mpp_handler_seconds", "Time spent in message and command handlers", ("handler",))
+        self.messages_received = self.metrics.counter("mpp_messages_received_total", "Decoded inbound messages by type", ("type",))
+        self.messages_sent = self.metrics.counter("mpp_messages_sent_total", "Outbound messages by type", ("type",))
+        self.queue_depth = self.metrics.gauge("mpp_queue_depth", "Messages currently waiting in a queue", ("queue",))
+        self.queue_high_water = self.metrics.gauge("mpp_queue_high_water", "Most messages seen waiting in a queue", ("queue",))
+        self.tick_duration = self.metrics.histogram("mpp_tick_seconds", "Time spent in one simulation tick")
+        self.tick_overruns = self.metrics.counter("mpp_tick_overruns_total", "Simulation ticks that took longer than 1 / tps")
+        self.loop_lag = self.metrics.histogram("mpp_event_loop_lag_seconds", "How much later than requested the simulation loop woke up")
+        self.queue_depth.set_function(self.inbound_queue.qsize, "inbound")
+        self.queue_depth.set_function(self.outbound_queue.qsize, "outbound")
+        self.handlers_pending = self.metrics.gauge("mpp_handlers_pending", "Handler jobs queued or running in the dispatcher")
+        self.handlers_running = self.metrics.gauge("mpp_handlers_running", "Handler jobs currently running in the dispatcher")
+        self.handler_failures = self.metrics.counter("mpp_handler_failures_total", "Handler jobs that raised or timed out", ("handler", "reason"))
+        self.task_failures = self.metrics.counter("mpp_task_failures_total", "Scheduled tasks that raised", ("task", "reason"))
+        self.handlers_pending.set_function(lambda: self.dispatcher.pending)
+        self.handlers_running.set_function(lambda: self.dispatcher.running)
+        self.metrics_server = MetricsServer(self.metrics, config.metrics_host, config.metrics_port) if config.metrics_port else None
         self.is_running = True
         self.retry_count = 0
 
-        self._client_tick_hz = 5
+        self.scheduler = Scheduler(config.idle_tps, config.tick_budget, on_error=self.handle_task_error)
+        self.scheduler.every(NoteQuota.TICK_INTERVAL / 1000, self.handle_note_quota_usage, "note_quota_usage")
+        self.playback_task: Optional[ScheduledTask] = None
+        midi_limits = MidiLimits(config.midi_max_tracks, config.midi_max_events, config.midi_max_duration, config.midi_max_density)
+        self.midi_store = MidiStore(os.path.abspath("instance/midis"), midi_limits)
+        self.downloader = Downloader(self.midi_store.incoming, config.download_max_size, config.download_timeout, config.download_concurrency)
+
         self._delta_time = 1 / self.tps
 
     def __enter__(self):
-        self.db = DatabaseManager(self.instance, self.debug)
+        self.db = DatabaseManager(self.instance, self.debug, write_behind=config.write_behind)
+        self.db.import_legacy_midis(self.midi_store)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is not None:
-            self.logger.log(Debug.ERROR, f"Uncaught exception occurred: {exc_type}, {exc_val}")
+            self.logger.log(Debug.ERROR, "Uncaught exception occurred: %s, %s", exc_type, exc_val)
+            crash_log_path = os.path.abspath(f"instance/logs/crash-{time.strftime('%Y%m%d-%H%M%S')}.log")
+            os.makedirs(os.path.dirname(crash_log_path), exist_ok=True)
+            self.logger.dump(crash_log_path)
 
-        self.db.close()
+        try:
+            self.db.flush()
+        except WriteBehindError as e:
+            self.logger.log(Debug.ERROR, e.error)
+        finally:
+            self.db.close()
 
         return False
 
     async def run(self):
-        while self.is_running:
-            try:
-                await self.connect()
-                pull_task = asyncio.create_task(self.pull_task())
-                push_task = asyncio.create_task(self.push_task())
-                connection_task = asyncio.create_task(self.handle_connection())
-                server_handler_task = asyncio.create_task(self.handle_message())
-                simulation_task = asyncio.create_task(self.simulation_loop())
-                await asyncio.gather(push_task, pull_task, connection_task, server_handler_task, simulation_task)
-            except websockets.ConnectionClosedError as e:
-                delay = max(self.retry_count ** 2, config.max_retry_delay)
-                self.logger.log(Debug.CONNECTION, f"WebSocket connection closed: code={e.code}, error={e}")
-                self.logger.log(Debug.CONNECTION, f"Attempting to reconnect in {delay} seconds... (Attempt {self.retry_count})")
-                await asyncio.sleep(delay)
-                self.retry_count += 1
-            except BotTermination as e:
-                self.logger.log(Debug.ERROR, e.error)
-                self.is_running = False
-            finally:
-                await self.disconnect()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+            self.logger.log(Debug.CONNECTION, "Serving metrics on http://%s:%s/metrics", self.metrics_server.host, self.metrics_server.port)
+        try:
+            while self.is_running:
+                try:
+                    await self.connect()
+                    pull_task = asyncio.create_task(self.pull_task())
+                    push_task = asyncio.create_task(self.push_task())
+                    connection_task = asyncio.create_task(self.handle_connection())
+                    server_handler_task = asyncio.create_task(self.handle_message())
+                    simulation_task = asyncio.create_task(self.simulation_loop())
+                    await asyncio.gather(push_task, pull_task, connection_task, server_handler_task, simulation_task)
+                except websockets.ConnectionClosedError as e:
+                    delay = max(self.retry_count ** 2, config.max_retry_delay)
+                    self.logger.log(Debug.CONNECTION, "WebSocket connection closed: code=%s, error=%s", e.code, e)
+                    self.logger.log(Debug.CONNECTION, "Attempting to reconnect in %s seconds... (Attempt %s)", delay, self.retry_count)
+                    await asyncio.sleep(delay)
+                    self.retry_count += 1
+                except BotTermination as e:
+                    self.logger.log(Debug.ERROR, e.error)
+                    self.is_running = False
+                finally:
+                    await self.disconnect()
+        finally:
+            await self.dispatcher.close()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
 
     async def simulation_loop(self):
+        loop = asyncio.get_running_loop()
         while True:
-            start_time = asyncio.get_running_loop().time()
-
-            # Stuff
-
-            elapsed_time = asyncio.get_running_loop().time() - start_time
-            await asyncio.sleep(max(0.0, 1 / self.tps - elapsed_time))
+            start_time = loop.time()
+
+            await self.scheduler.tick()
+
+            elapsed_time = loop.time() - start_time
+            self.tick_duration.observe(elapsed_time)
+            if elapsed_time > 1 / self.tps:
+                self.tick_overruns.inc()
+            delay = max(0.0, 1 / self.tps - elapsed_time)
+            sleep_start = loop.time()
+            await asyncio.sleep(delay)
+            self.loop_lag.observe(max(0.0, loop.time() - sleep_start - delay))
             self.dt = max(1 / self.tps, elapsed_time)
 
+    def handle_task_error(self, task: ScheduledTask, error: BaseException):
+        """Count and log a failed scheduled task; playback is stopped instead of failing again on every tick."""
+        self.task_failures.inc(task.name, type(error).__name__)
+        self.logger.log(Debug.ERROR, "Scheduled task '%s' failed: %r", task.name, error)
+        if task is self.playback_task:
+            self.stop_playback()
+
+    async def handle_playback(self):
+        now = self.time_sync.server_now()
+        if self.player is not None:
+            message = self.player.advance(now)
+            if message is not None:
+                await self.outbound_queue.put([message])
+            if self.player.finished:
+                self.logger.log(Debug.PLAYBACK, "Finished playing MIDI: '%s'", self.player.name)
+                self.player = None
+        if self.scoring is not None and self.scoring.is_over(now):
+            await self.outbound_queue.put(self.get_score_messages(now))
+            self.scoring = None
+        if self.player is None and self.scoring is None:
+            self.stop_playback()
+
+    def handle_note_quota_usage(self):
+        spent, dropped = self.note_quota.report()
+        if spent or dropped:
+            self.logger.log(Debug.PLAYBACK, "Note quota usage: spent=%s, dropped=%s, points=%s/%s", spent, dropped, self.note_quota.points, self.note_quota.max)
+
     async def connect(self):
         self.websocket = await websockets.connect(f"wss://{self.host}:{self.port}")
+        self.time_sync.reset()
         self.logger.log(Debug.CONNECTION, "Authenticating with token...")
         request = [MPPMessage(MPPMessage.ServerBound.CONNECT, token=self.token)]
         await self.send(request)
-        self.logger.log(Debug.CONNECTION, f"Setting user '{self.name}' and joining channel '{self.channel}'...")
+        self.logger.log(Debug.CONNECTION, "Setting user '%s' and joining channel '%s'...", self.name, self.channel)
         request = [MPPMessage(MPPMessage.ServerBound.USERSET, set={"name": self.name, "color": self.color}), MPPMessage(MPPMessage.ServerBound.SETCHANNEL, _id=self.channel)]
         await self.send(request)
         self.logger.log(Debug.CONNECTION, "Connected to MPP!")
@@ -100,151 +207,268 @@ class MPPClient:
 
     async def recv(self) -> List[MPPMessage]:
         data = await self.websocket.recv()
-        messages = MPPMessage.deserialize(data)
+        messages = MPPMessage.deserialize(data, self.decoded_types)
         return messages
 
     async def pull_task(self):
         while True:
             messages = await self.recv()
+            if not messages:
+                continue
             await self.inbound_queue.put(messages)
-            for message in messages:
-                self.logger.log(Debug.INBOUND, f"Received ({message.type}) message: {str(message)}")
+            self.queue_high_water.track_max(self.inbound_queue.qsize(), "inbound")
+            if self.logger.active(Debug.INBOUND):
+                for message in messages:
+                    self.logger.log(Debug.INBOUND, "Received (%s) message: %s", message.type, message)
 
     async def push_task(self):
         while True:
             messages = await self.outbound_queue.get()
+            self.queue_high_water.track_max(self.outbound_queue.qsize() + len(messages), "outbound")
+            messages = self.apply_note_quota(messages)
+            if not messages:
+                continue
             await self.send(messages)
             for message in messages:
-                self.logger.log(Debug.OUTBOUND, f"Sent ({message.type}) message: {str(message)}")
+                self.messages_sent.inc(message.type.m)
+            if self.logger.active(Debug.OUTBOUND):
+                for message in messages:
+                    self.logger.log(Debug.OUTBOUND, "Sent (%s) message: %s", message.type, message)
+
+    def apply_note_quota(self, messages: List[MPPMessage]) -> List[MPPMessage]:
+        filtered = []
+        for message in messages:
+            if message.type is MPPMessage.ServerBound.NOTES:
+                message = self.note_quota.filter(message, self.get_time())
+                if message is None:
+                    continue
+            filtered.append(message)
+        return filtered
 
     async def handle_connection(self):
         while True:
             request = [MPPMessage(MPPMessage.ServerBound.PING, e=self.get_time())]
             await self.outbound_queue.put(request)
-            await asyncio.sleep(20)
+            await asyncio.sleep(self.time_sync.probe_interval)
 
     async def handle_message(self):
         while True:
             messages: List[MPPMessage] = await self.inbound_queue.get()
+            cursors = []
             for message in messages:
-                handler = getattr(self, f"handle_{message.type.m}_message")
-                await handler(message)
-                    
-    async def handle_a_message(self, message: MPPMessage):
+                m = message.type.m
+                self.messages_received.inc(m)
+                if self.batch_cursors and m == MPPMessage.ClientBound.MOUSE.m:
+                    # Cursor moves only touch the participant store, so a batch of them is applied in one go
+                    cursors.append(message)
+                    continue
+                lane = self.get_handler_lane(message)
+                if lane is None:
+                    try:
+                        await self.run_handler(m, message)
+                    except Exception as e:
+                        # A malformed message must not take the receive loop down with it
+                        self.handle_handler_error(m, message, e)
+                else:
+                    after = (self.MEMBERSHIP_LANE,) if lane != self.MEMBERSHIP_LANE else ()
+                    await self.dispatcher.submit(lane, self.run_handler, m, message, name=m, after=after)
+            if cursors:
+                start_time = time.perf_counter()
+                try:
+                    self.update_cursors(cursors)
+                except Exception as e:
+                    self.handle_handler_error(MPPMessage.ClientBound.MOUSE.m, cursors[-1], e)
+                finally:
+                    self.handler_latency.observe(time.perf_counter() - start_time, MPPMessage.ClientBound.MOUSE.m)
+
+    def get_handler_lane(self, message: MPPMessage) -> Optional[Hashable]:
+        """
+        The dispatcher lane a message is handled on, or ``None`` to handle it inline.
+
+        Chat gets a lane per sender, so a slow command only holds up its sender's later messages, and waits for the
+        membership changes received before it. Handlers that only update in-memory state stay inline.
+        """
+        m = message.type.m
+        if m in self.MEMBERSHIP_TYPES:
+            return self.MEMBERSHIP_LANE
+        if m == MPPMessage.ClientBound.MESSAGE.m:
+            return m, message.sender
+        return None
+
+    async def run_handler(self, m: str, message: MPPMessage):
+        start_time = time.perf_counter()
+        try:
+            await self.message_handlers[m](message)
+        finally:
+            self.handler_latency.observe(time.perf_counter() - start_time, m)
+
+    def handle_dispatch_error(self, job: HandlerJob, error: BaseException):
+        self.handle_handler_error(job.name, job.args[-1], error)
+
+    def handle_handler_error(self, name: str, message: MPPMessage, error: BaseException):
+        """Count and log a failed handler, inline or on a lane, and tell a chat sender when their command timed out."""
+        reason = "timeout" if isinstance(error, HandlerTimeoutError) else type(error).__name__
+        self.handler_failures.inc(name, reason)
+        self.logger.log(Debug.ERROR, "Handler '%s' failed: %r", name, error)
+        if isinstance(message, ChatMessage) and isinstance(error, HandlerTimeoutError):
+            response = [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=error.error, reply_to=message.id)]
+            self.outbound_queue.put_nowait(response)
+
+    async def handle_a_message(self, message: ChatMessage):
         """MESSAGE"""
         sender = self.participants.get(message.sender)
-        msg = message.payload["a"].strip()
+        msg = message.a.strip()
         if msg.startswith(self.prefix) and len(msg) > 1:
             try:
                 command = CommandMessage.deserialize(msg)
                 await self.handle_command(command, message, sender)
             except (ArgumentValueError, OptionValueError, ArgumentMissingError, OptionMutualExclusivityError) as e:
-                response = [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=e.error, reply_to=message.payload["id"])]
+                response = [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=e.error, reply_to=message.id)]
                 await self.outbound_queue.put(response)
-    
-    async def handle_dm_message(self, message: MPPMessage):
+
+    @noop
+    async def handle_dm_message(self, message: DirectMessage):
         """DIRECTMESSAGE"""
         pass
 
-    async def handle_b_message(self, message: MPPMessage):
+    @noop
+    async def handle_b_message(self, message: VerifyMessage):
         """VERIFY"""
         pass
 
-    async def handle_bye_message(self, message: MPPMessage):
+    async def handle_bye_message(self, message: DisconnectMessage):
         """DISCONNECT"""
-        participant = self.participants[message.sender]
-        await self.handle_participant(participant)
+        participant = self.participants.pop(message.sender, None)
+        self.positions.remove(message.sender)
+        if participant is not None:
+            await self.handle_participants([], [participant])
 
-    async def handle_c_message(self, message: MPPMessage):
+    @noop
+    async def handle_c_message(self, message: ChatHistoryMessage):
         """CHATHISTORY"""
         pass
 
-    async def handle_ch_message(self, message: MPPMessage):
+    async def handle_ch_message(self, message: ChannelInfoMessage):
         """CHANNELINFO"""
-        for participant_info in message.payload.get("ppl"):
-            participant = Participant.deserialize(participant_info)
-            self.participants[participant.client_id] = participant
-            await self.handle_participant(participant)
+        await self.handle_participant_snapshot(message.ppl, complete=True)
 
-    async def handle_custom_message(self, message: MPPMessage):
+    @noop
+    async def handle_custom_message(self, message: CustomMessage):
         """CUSTOM"""
         pass
 
-    async def handle_hi_message(self, message: MPPMessage):
+    async def handle_hi_message(self, message: ConnectMessage):
         """CONNECT"""
-        pass
+        self.client_id = message.u["_id"]
 
-    async def handle_ls_message(self, message: MPPMessage):
+    @noop
+    async def handle_ls_message(self, message: RoomListMessage):
         """ROOMLIST"""
         pass
 
-    async def handle_m_message(self, message: MPPMessage):
+    async def handle_m_message(self, message: MouseMessage):
         """MOUSE"""
-        pass
+        self.update_cursors([message])
 
-    async def handle_n_message(self, message: MPPMessage):
+    def update_cursors(self, messages: List[MouseMessage]):
+        """Batched MOUSE handler, used instead of ``handle_m_message`` unless a subclass replaces that."""
+        self.positions.update_many([(message.sender, float(message.x), float(message.y)) for message in messages])
+
+    async def handle_n_message(self, message: NotesMessage):
         """NOTES"""
-        pass
+        if self.scoring is not None and message.sender != self.client_id:
+            self.scoring.handle_notes(message.sender, message.t, message.n)
 
-    async def handle_notification_message(self, message: MPPMessage):
+    @noop
+    async def handle_notification_message(self, message: NotificationMessage):
         """NOTIFICATION"""
         pass
 
-    async def handle_nq_message(self, message: MPPMessage):
+    async def handle_nq_message(self, message: NoteQuotaMessage):
         """NOTEQUOTA"""
-        pass
+        self.note_quota.set_params(message.allowance, message.max, message.maxHistLen)
+        self.logger.log(Debug.PLAYBACK, "Note quota updated: %s", self.note_quota)
 
-    async def handle_p_message(self, message: MPPMessage):
+    async def handle_p_message(self, message: ParticipantMessage):
         """PARTICIPANTADDED"""
-        participant = Participant.deserialize(message.payload)
-        self.participants[participant.client_id] = participant
-        await self.handle_participant(participant)
+        await self.handle_participant_snapshot([message.payload], complete=False)
 
-    async def handle_t_message(self, message: MPPMessage):
+    async def handle_t_message(self, message: PongMessage):
         """PONG"""
-        pass
+        if message.e is not None:
+            self.time_sync.add_sample(message.e, message.t, self.get_time())
+            self.logger.log(Debug.CONNECTION, "Clock sync: offset=%sms, rtt=%s", self.time_sync.offset, self.time_sync.rtt_distribution)
 
-    async def handle_unknown_message(self, message: MPPMessage):
+    @noop
+    async def handle_unknown_message(self, message: UnknownMessage):
         """UNKNOWN"""
         pass
 
+    async def handle_participant_snapshot(self, participant_infos: List[dict], complete: bool):
+        """Diff participant infos against ``self.participants`` and only persist joins, renames and (if ``complete``) leaves."""
+        present, left, seen = [], [], set()
+        for participant_info in participant_infos:
+            client_id = participant_info["id"]
+            seen.add(client_id)
+            known = self.participants.get(client_id)
+            if known is None or known.name != participant_info["name"]:
+                participant = Participant.deserialize(participant_info)
+                self.participants[client_id] = participant
+                self.positions.add(participant)
+                present.append(participant)
+            else:
+                known.color = participant_info["color"]
+                self.positions.update_color(client_id, known.color)
+                self.positions.update(client_id, float(participant_info["x"]), float(participant_info["y"]))
+        if complete:
+            for client_id in [client_id for client_id in self.participants if client_id not in seen]:
+                left.append(self.participants.pop(client_id))
+                self.positions.remove(client_id)
+        if present or left:
+            await self.handle_participants(present, left)
+
     async def handle_participant(self, participant: Participant):
+        await self.handle_participants([participant], [])
+
+    async def handle_participants(self, present: List[Participant], left: List[Participant]):
         now = sqliteutils.datetime_to_string()
-        if not self.db.user_exists(participant.client_id):
-            role = "bot" if participant.tag is not None and participant.tag.text == "BOT" else "user"
-            values = {
-                "client_id": participant.client_id,
-                "roles": role,
-                "usernames": participant.name,
-                "added_at": now,
-                "last_seen": now
-            }
-            self.db.add_user(values)
-        else:
-            aliases = self.db.get_user_column(participant.client_id, "usernames")
-            usernames = aliases + ("\0{}".format(participant.name) if participant.name not in aliases.split("\0") else "")
-            values = {
-                "last_seen": now
-            }
-            if usernames != aliases:
-                values["usernames"] = usernames
-            self.db.update_user(participant.client_id, values)
+        known = await self.db.get_users_column_async([participant.client_id for participant in present + left], "client_id")
+        with self.db.transaction():
+            for participant in present:
+                if participant.client_id not in known:
+                    role = "bot" if participant.tag is not None and participant.tag.text == "BOT" else "user"
+                    values = {
+                        "client_id": participant.client_id,
+                        "roles": Role.mask_from_names([role]),
+                        "added_at": now,
+                        "last_seen": now
+                    }
+                    self.db.add_user(values)
+                    known[participant.client_id] = participant.client_id
+                else:
+                    self.db.update_user(participant.client_id, {"last_seen": now})
+                self.db.add_username({"client_id": participant.client_id, "name": participant.name, "last_seen": now})
+            for participant in left:
+                if participant.client_id in known:
+                    self.db.update_user(participant.client_id, {"last_seen": now})
 
     async def handle_command(self, command: CommandMessage, message: MPPMessage, sender: Participant):
         handler = getattr(self, f"handle_{command.type.name}_command")
         try:
             await self.handle_command_authorization(command, message, sender)
+            start_time = time.perf_counter()
             await handler(command, message, sender)
+            self.handler_latency.observe(time.perf_counter() - start_time, f"!{command.type.name}")
         except CommandAuthorizationError as e:
             response = [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=e.error, reply_to=message.payload["id"])]
             await self.outbound_queue.put(response)
 
     async def handle_command_authorization(self, command: CommandMessage, message: MPPMessage, sender: Participant):
-        user_roles = self.db.get_user_roles(sender.client_id)
-        command_roles = command.type.roles
-        if command_roles is None or all(role in user_roles for role in command_roles):
+        required = command.type.role_mask
+        if not required:
             return
-        elif command_roles is not None and not all(role in user_roles for role in command_roles):
+        user_mask = await self.db.get_user_role_mask_async(sender.client_id)
+        if (user_mask & required) != required:
             command_role_names = [role.name for role in command.type.roles]
             raise CommandAuthorizationError(command.type.name, command_role_names)
 
@@ -276,64 +500,135 @@ class MPPClient:
         msgs = []
         try:
             if command.opts["list"]:
-                downloaded_midis = self.db.get_midi_filenames()
+                downloaded_midis = await self.db.get_midi_filenames_async()
                 midi_list_string = ", ".join(['`{}`'.format(midi) for midi in downloaded_midis])
                 msgs.append(f"MIDIs: {midi_list_string}")
             else:
                 query = command.args['midi']
                 if regex.is_valid_url(query):
                     filename = command.opts["output"] if "output" in command.opts else query.split("/")[-1]
-                    self.download_midi(query, filename=filename)
-                    downloaded_midis = self.db.get_midi_filenames()
+                    filename, sha256 = await self.download_midi(query, filename=filename)
+                    previous_sha256 = await self.db.get_midi_hash_async(filename)
+                    downloaded_midis = await self.db.get_midi_filenames_async()
                     values = {
                         "filename": filename,
-                        "uploader_id": self.db.get_user_column(sender.client_id, "id")
+                        "uploader_id": await self.db.get_user_column_async(sender.client_id, "id"),
+                        "sha256": sha256
                     }
                     if filename in downloaded_midis:
                         values.update({"added_at": sqliteutils.datetime_to_string()})
                         self.db.update_midi(filename, values)
+                        if previous_sha256 not in (None, sha256) and not await self.db.count_midi_references_async(previous_sha256):
+                            self.midi_store.remove(previous_sha256)
                     else:
                         self.db.add_midi(values)
                     msgs.append(f"Successfully downloaded MIDI: `{filename}`")
-                    # Add gaming task to simulation loop scheduler
+                    self.start_playback(filename, sha256)
+                    msgs.append(f"Now playing: `{filename}`")
                 else:
-                    results = self.search_midis(query)
+                    results = await self.search_midis(query)
                     if results is not None:
+                        if len(results) > 1 and query in results:
+                            results = [query]
                         if len(results) > 1:
                             found_midis_string = ", ".join(['`{}`'.format(midi) for midi in results])
                             msgs.append(f"Multiple results found: {found_midis_string}")
                             msgs.append(f"Please select one with `!gaming <file_name.mid>`")
                         else:
                             msgs.append(f"Result found: `{results[0]}`")
-                            # Add gaming task to simulation loop scheduler
+                            self.start_playback(results[0], await self.db.get_midi_hash_async(results[0]))
+                            msgs.append(f"Now playing: `{results[0]}`")
                     else:
                         msgs.append("No results found. Do `!gaming -l` to browse downloaded MIDIs")
             response.extend([MPPMessage(MPPMessage.ServerBound.MESSAGE, message=msg) for msg in msgs])
-        except HTTPError as e:
+        except (HTTPError, MidiParseError, DownloadError) as e:
+            response.extend([MPPMessage(MPPMessage.ServerBound.MESSAGE, message=msg) for msg in msgs])
             response.append(MPPMessage(MPPMessage.ServerBound.MESSAGE, message=e.error, reply_to=message.payload["id"]))
         await self.outbound_queue.put(response)
 
+    async def handle_metrics_command(self, command: CommandMessage, message: MPPMessage, sender: Participant):
+        """METRICS"""
+        response = [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=msg) for msg in self.get_metrics_summary()]
+        await self.outbound_queue.put(response)
+
     async def handle_unknown_command(self, command: CommandMessage, message: MPPMessage, sender: Participant):
         """UNKNOWN"""
         pass
 
-    def download_midi(self, url: str, filename: str = None):
-        filename = url.split("/")[-1] if filename is None else filename
-        response = requests.get(url)
-        if response.status_code == 200:
-            destination_path = os.path.abspath("instance/midis/" + filename)
-            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
-            with open(destination_path, 'wb') as file:
-                file.write(response.content)
-            self.logger.log(Debug.FILESYSTEM, f"Downloaded new MIDI file: '{destination_path}'")
-        else:
-            self.logger.log(Debug.ERROR, f"Failed to download new MIDI file: '{filename}'")
-            raise HTTPError(url, response.status_code)
-
-    def search_midis(self, query: str) -> Optional[list[str]]:
-        searchable_files = self.db.get_midi_filenames()
-        results = regex.search_engine(query, searchable_files)
-        return [os.path.basename(result) for result in results] if results is not None else None
+    async def download_midi(self, url: str, filename: str = None) -> Tuple[str, str]:
+        """Download a MIDI, validate it and move it into the MIDI store; returns its file name and content hash."""
+        filename = os.path.basename(url.split("/")[-1] if filename is None else filename)
+
+        def report(received: int, total: Optional[int]):
+            percentage = f"{received / total:.0%} of " if total else ""
+            msg = f"Downloading `{filename}`: {percentage}{received / 1024:.0f} KiB" + (f"/{total / 1024:.0f} KiB" if total else "")
+            self.outbound_queue.put_nowait([MPPMessage(MPPMessage.ServerBound.MESSAGE, message=msg)])
+
+        try:
+            destination_path = await self.downloader.download(url, filename, report)
+        except (HTTPError, DownloadError) as e:
+            self.logger.log(Debug.ERROR, "Failed to download new MIDI file '%s': %s", filename, e)
+            raise
+        try:
+            sha256 = await asyncio.to_thread(self.midi_store.add_file, destination_path)
+        except MidiParseError as e:
+            self.logger.log(Debug.ERROR, "Downloaded MIDI file '%s' (%s) is invalid: %s", filename, e.filename, e.reason)
+            os.remove(destination_path)
+            # The error is replied in chat, so it names the file the user asked for instead of the path on this machine
+            raise MidiParseError(filename, e.reason) from e
+        self.logger.log(Debug.FILESYSTEM, "Downloaded new MIDI file: '%s' (sha256=%s)", filename, sha256)
+        return filename, sha256
+
+    def start_playback(self, filename: str, sha256: Optional[str]):
+        if sha256 is None or sha256 not in self.midi_store:
+            raise MidiParseError(filename, "the file is missing from the MIDI store")
+        try:
+            midi = self.midi_store.open(sha256)
+        except MidiParseError as e:
+            self.logger.log(Debug.ERROR, "Failed to open MIDI file '%s' (sha256=%s): %s", filename, sha256, e.reason)
+            raise MidiParseError(filename, e.reason) from e
+        self.stop_playback()
+        self.tps = config.playback_tps
+        self.playback_task = self.scheduler.each_tick(self.handle_playback, "playback")
+        window = round(1000 / self.tps) + config.playback_window
+        start_time = self.time_sync.server_now() + config.playback_lead_in
+        self.player = MidiPlayer(midi, start_time, window, name=filename)
+        self.scoring = ScoringEngine(midi, start_time, config.scoring_window)
+        self.logger.log(Debug.PLAYBACK, "Started playing MIDI: '%s' (%s events, %sms)", filename, len(midi), midi.duration)
+
+    def stop_playback(self):
+        if self.playback_task is not None:
+            self.playback_task.cancel()
+            self.playback_task = None
+        self.tps = config.idle_tps
+
+    def get_score_messages(self, now: int) -> List[MPPMessage]:
+        expected = self.scoring.expected(now)
+        results = self.scoring.results(now)
+        if not results:
+            return [MPPMessage(MPPMessage.ServerBound.MESSAGE, message="Game over! Nobody played along this time")]
+        msgs = ["Game over! Results:"]
+        for rank, score in enumerate(results, start=1):
+            participant = self.participants.get(score.client_id)
+            name = participant.name if participant is not None else score.client_id
+            msgs.append(f"{rank}. {name}: {score.accuracy(expected):.1%} accuracy ({score.hits} hits, {score.misses(expected)} misses, {score.extras} extra)")
+        return [MPPMessage(MPPMessage.ServerBound.MESSAGE, message=msg) for msg in msgs]
+
+    def get_metrics_summary(self) -> List[str]:
+        received = sorted(self.messages_received.values.items(), key=lambda item: -item[1])
+        received_string = ", ".join(f"{labels[0]}={int(count)}" for labels, count in received[:5])
+        handlers = sorted(self.handler_latency.series, key=lambda labels: -self.handler_latency.mean(*labels))
+        handlers_string = ", ".join(f"{labels[0]} {self.handler_latency.mean(*labels) * 1000:.2f}ms avg / {self.handler_latency.quantile(0.99, *labels) * 1000:.1f}ms p99" for labels in handlers[:3])
+        return [
+            f"Messages: {int(self.messages_received.total())} received ({received_string}), {int(self.messages_sent.total())} sent",
+            f"Queues: inbound {self.queue_depth.get('inbound')} (max {self.queue_high_water.get('inbound')}), outbound {self.queue_depth.get('outbound')} (max {self.queue_high_water.get('outbound')})",
+            f"Ticks: {self.tick_duration.count()} at {self.tps}tps, {int(self.tick_overruns.total())} overrun(s), loop lag {self.loop_lag.quantile(0.99) * 1000:.1f}ms p99 / {self.loop_lag.maximum() * 1000:.1f}ms max",
+            f"Slowest handlers: {handlers_string or 'none yet'}"
+        ]
+
+    async def search_midis(self, query: str) -> Optional[list[str]]:
+        results = self.db.search_midis(query, config.search_results)
+        return [os.path.basename(result) for result in results] if results else None
 
     @staticmethod
     def get_time():
@@ -341,11 +636,11 @@ class MPPClient:
 
     @property
     def tps(self) -> float:
-        return self._client_tick_hz
+        return self.scheduler.tps
 
     @tps.setter
     def tps(self, client_tick_hz: float):
-        self._client_tick_hz = client_tick_hz
+        self.scheduler.tps = client_tick_hz
 
     @property
     def dt(self) -> float:
@@ -354,3 +649,6 @@ class MPPClient:
     @dt.setter
     def dt(self, delta_time: float):
         self._delta_time = delta_time
+
+
+MPPClient.dispatch_table = DispatchTable.build(MPPClient)
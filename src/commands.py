@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import List, Dict, Any, Optional
-from src.roles import Role
+from typing import List, Dict, Any, Optional, FrozenSet
+from src.roles import Role, RoleFlag
 from config import Config, CommandsType
 
 config = Config()
@@ -65,6 +65,13 @@ class Commands(Enum):
         ]
     )
 
+    METRICS = (
+        "Shows runtime metrics: message counts, handler latency, queue depth and simulation loop lag",
+        ["owner"],
+        [],
+        []
+    )
+
     GAMING = (
         "Rhythm gaming brought straight to your piano! Provide a link to or filename of a .mid and get rewarded with score based on your performance accuracy",
         ["user"],
@@ -76,12 +83,39 @@ class Commands(Enum):
     )
 
 
+class CommandGrammar:
+    """Lookup tables for one command's arguments and options, compiled once per command instead of scanned per message."""
+
+    __slots__ = ("arg_names", "arg_types", "arg_trailing", "opt_names", "opt_types", "opt_chars", "value_opt_chars")
+
+    def __init__(self, args: List[Dict[str, Any]], opts: List[Dict[str, Any]]):
+        self.arg_names = tuple(arg["name"] for arg in args)
+        self.arg_types = tuple(arg["type"] for arg in args)
+        self.arg_trailing = tuple(arg["trailing"] for arg in args)
+        self.opt_names = {}
+        self.opt_types = {}
+        for opt in opts:
+            self.opt_names.setdefault(opt["character"], opt["name"])
+            self.opt_types.setdefault(opt["character"], opt["type"])
+        self.opt_chars = frozenset(self.opt_names)
+        self.value_opt_chars = frozenset(character for character, option_type in self.opt_types.items() if option_type is not bool)
+
+    def __str__(self):
+        return f"CommandGrammar Object: (args={self.arg_names}, opts={self.opt_names})"
+
+
 class Command:
 
     commands: CommandsType = config.commands
 
     __members__ = {**{name: member.value for name, member in commands.__members__.items()}, **{"UNKNOWN": ("Failsafe pseudo-member", None, [], [])}}
 
+    __role_masks__ = {name: Role.mask_from_names(args[1]) if args[1] is not None else RoleFlag(0) for name, args in __members__.items()}
+
+    __grammars__ = {name: CommandGrammar(args[2], args[3]) for name, args in __members__.items()}
+
+    __names__ = {name.casefold(): name for name in __members__}
+
     def __init__(self, name: str, description: str, roles: Optional[List[str]], args: List[Dict[str, Any]], opts: List[Dict[str, Any]]):
         self.description = description
         self.args = args
@@ -89,6 +123,8 @@ class Command:
 
         self._name = name
         self._roles = roles
+        self.role_mask = self.__role_masks__.get(name, RoleFlag(0))
+        self.grammar = self.__grammars__.get(name) or CommandGrammar(args, opts)
 
     def __str__(self):
         return f"{self._name}"
@@ -106,28 +142,15 @@ class Command:
         return argument_name
 
     def get_opt_type(self, character: str) -> Optional[Any]:
-        option_type = None
-        for opt in self.opts:
-            if opt["character"] == character:
-                option_type = opt["type"]
-                break
-        return option_type
+        return self.grammar.opt_types.get(character)
 
     def get_opt_name(self, character: str) -> Optional[str]:
-        option_name = None
-        for opt in self.opts:
-            if opt["character"] == character:
-                option_name = opt["name"]
-                break
-        return option_name
+        return self.grammar.opt_names.get(character)
 
     @classmethod
     def from_name(cls, command_name: str) -> "Command":
-        name, args = "UNKNOWN", cls.__members__["UNKNOWN"]
-        for key, value in cls.__members__.items():
-            if command_name.casefold() == key.casefold():
-                name, args = key, value
-        return cls(name, *args)
+        name = cls.__names__.get(command_name.casefold(), "UNKNOWN")
+        return cls(name, *cls.__members__[name])
 
     @classmethod
     def get_commands(cls) -> List["Command"]:
@@ -146,5 +169,5 @@ class Command:
         return [Role.from_name(role) for role in self._roles] if self._roles is not None else None
 
     @property
-    def opt_chars(self) -> List[str]:
-        return [opt["character"] for opt in self.opts]
+    def opt_chars(self) -> FrozenSet[str]:
+        return self.grammar.opt_chars
@@ -1,7 +1,15 @@
-import sqlite3, os
-from typing import Optional, Any, List
-from src.roles import Role
+import asyncio, os, threading
+from contextlib import contextmanager
+from typing import Optional, Any, List, Dict, Iterable, Callable
+from src.roles import Role, RoleFlag
 from src.lib import Logger, Debug
+from src.lib.log_sink import KeyValues
+from src.lib.connection_pool import ConnectionPool
+from src.lib.write_behind import WriteBehindBuffer, upsert_statement
+from src.lib.lru_cache import LRUCache
+from src.lib.search import SearchIndex
+from src.lib.midi_store import MidiStore
+from src.lib.exceptions import MidiParseError
 from src.utils import sqliteutils
 from config import Config
 
@@ -9,27 +17,46 @@ config = Config()
 
 
 class DatabaseManager:
-    def __init__(self, db_name: str, debug: int):
+    def __init__(self, db_name: str, debug: int, write_behind: bool = False):
         self.debug = debug
         self.schema = config.schema
         self.defaults = config.defaults
-        self.logger = Logger(self.__class__.__name__, self.debug)
+        self.logger = Logger(self.__class__.__name__, self.debug, config.log_capture)
 
         db_path = os.path.abspath("instance/" + db_name + ".db")
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-        self.connection = sqlite3.connect(db_path)
+        self.pool = ConnectionPool(db_path, config.database_readers)
+        self.connection = self.pool.writer
         self.cursor = self.connection.cursor()
 
+        self.write_behind: Optional[WriteBehindBuffer] = None
+        self.user_cache = LRUCache(config.user_cache_size)
+        self.midi_index = SearchIndex(config.search_similarity_threshold)
+
+        self._transaction_depth = 0
+        self._transaction_thread: Optional[int] = None
+
         self.create_all()
+        self.migrate_usernames()
+        self.migrate_roles_to_mask()
+        self.migrate_midi_hashes()
+        self.warm_user_cache()
+        self.midi_index.add_many(self.get_midi_filenames())
+
+        if write_behind:
+            self.write_behind = WriteBehindBuffer(self.pool, self.logger, config.write_behind_batch_size, config.write_behind_interval)
 
     def create_all(self):
+        adders = {"users": self.add_user, "usernames": self.add_username}
         for table in self.schema["tables"]:
             table_name = table["name"]
             if not self.table_exists(table_name):
                 column_def = sqliteutils.get_column_def(table["columns"])
                 foreign_key_def = sqliteutils.get_foreign_key_def(table["foreign_keys"]) if "foreign_keys" in table else None
                 self.create_table(table_name, column_def, foreign_key_def)
+                for index_def in sqliteutils.get_index_defs(table_name, table.get("indexes", [])):
+                    self.execute(index_def)
                 if table_name in self.defaults["defaults"]:
                     for row in self.defaults["defaults"][table_name]:
                         for column in table["columns"]:
@@ -40,98 +67,391 @@ class DatabaseManager:
                                     row[column["column_name"]] = function()
                                 else:
                                     row[column["column_name"]] = function(*args)
-                        self.add_row(table_name, row)
+                        if table_name in adders:
+                            adders[table_name](row)
+                        else:
+                            self.add_row(table_name, row)
+
+    def rebuild_table(self, table_name: str, expressions: Dict[str, str] = None):
+        """
+        Recreate a table from its schema definition and copy over the columns the old table shares with it.
+
+        SQLite cannot change or drop columns in place, so schema migrations go through a rebuild; ``expressions`` maps
+        column names to SQL expressions that convert the old values. Row ids are preserved.
+        """
+        expressions = expressions or {}
+        existing = {row[1] for row in self.fetch_all(f"PRAGMA table_info({table_name})")}
+        table = self.schema_get_table(table_name)
+        column_names = [column["column_name"] for column in table["columns"] if column["column_name"] in existing]
+        selected = [expressions.get(column_name, column_name) for column_name in column_names]
+        column_def = sqliteutils.get_column_def(table["columns"])
+        if "foreign_keys" in table:
+            column_def += ", " + sqliteutils.get_foreign_key_def(table["foreign_keys"])
+        with self.pool.writer_lock, self.connection:
+            self.connection.execute(f"CREATE TABLE {table_name}_migration ({column_def})")
+            self.connection.execute(f"INSERT INTO {table_name}_migration ({', '.join(column_names)}) SELECT {', '.join(selected)} FROM {table_name}")
+            self.connection.execute(f"DROP TABLE {table_name}")
+            self.connection.execute(f"ALTER TABLE {table_name}_migration RENAME TO {table_name}")
+            for index_def in sqliteutils.get_index_defs(table_name, table.get("indexes", [])):
+                self.connection.execute(index_def)
+
+    def migrate_usernames(self):
+        """Move the NUL-joined aliases of the old ``users.usernames`` column into the ``usernames`` history table."""
+        columns = {row[1] for row in self.fetch_all("PRAGMA table_info(users)")}
+        if "usernames" not in columns:
+            return
+        rows = self.fetch_all("SELECT client_id, usernames, added_at, last_seen FROM users WHERE usernames IS NOT NULL")
+        with self.pool.writer_lock, self.connection:
+            for client_id, usernames, added_at, last_seen in rows:
+                aliases = usernames.split("\0")
+                for index, name in enumerate(aliases):
+                    values = {
+                        "client_id": client_id,
+                        "name": name,
+                        "name_folded": name.casefold(),
+                        "first_seen": added_at,
+                        "last_seen": last_seen if index == len(aliases) - 1 else added_at
+                    }
+                    self.connection.execute(*upsert_statement("usernames", ("client_id", "name"), values, ("last_seen",)))
+        self.rebuild_table("users")
+        self.logger.log(Debug.DATABASE, "Migrated the aliases of %s user(s) to the usernames table", len(rows))
+
+    def migrate_roles_to_mask(self):
+        """Rebuild a ``users`` table that still stores roles as comma-separated names so they become an integer bitmask."""
+        if self.fetch_one("SELECT 1 FROM users WHERE typeof(roles) = 'text' LIMIT 1") is None:
+            return
+        with self.pool.writer_lock:
+            self.connection.create_function("roles_to_mask", 1, lambda roles: int(Role.mask_from_names(roles.split(","))) if roles else 0, deterministic=True)
+        self.rebuild_table("users", {"roles": "roles_to_mask(roles)"})
+        self.logger.log(Debug.DATABASE, "Migrated user roles from names to bitmasks")
+
+    def migrate_midi_hashes(self):
+        """Rebuild a ``midis`` table from before the content-addressed store so it gains the ``sha256`` column."""
+        columns = {row[1] for row in self.fetch_all("PRAGMA table_info(midis)")}
+        if "sha256" in columns:
+            return
+        self.rebuild_table("midis")
+        self.logger.log(Debug.DATABASE, "Added the sha256 column to the midis table")
+
+    def import_legacy_midis(self, store: MidiStore):
+        """Move MIDIs that are still stored under their file name into ``store`` and record their hashes."""
+        rows = self.fetch_all("SELECT filename FROM midis WHERE sha256 IS NULL")
+        imported = 0
+        for (filename,) in rows:
+            path = os.path.join(store.directory, filename)
+            if not os.path.isfile(path):
+                continue
+            try:
+                sha256 = store.add_file(path)
+            except MidiParseError as e:
+                self.logger.log(Debug.ERROR, "Could not import MIDI '%s' into the store: %s", filename, e.reason)
+                continue
+            self.update_row("midis", "filename", filename, {"sha256": sha256})
+            imported += 1
+        if imported:
+            self.logger.log(Debug.DATABASE, "Imported %s MIDI(s) into the content-addressed store", imported)
+
+    def warm_user_cache(self):
+        """Load the most recently seen users so lookups for regulars never reach the database."""
+        command = "SELECT * FROM users ORDER BY last_seen DESC LIMIT ?"
+        records = self.fetch_records(command, (self.user_cache.capacity,))
+        for record in reversed(records):
+            self.user_cache.put(record["client_id"], record)
+        self.logger.log(Debug.DATABASE, "Warmed user cache with %s user(s)", len(records))
 
     def close(self):
-        self.connection.close()
+        self.logger.log(Debug.DATABASE, "User cache hit rate: %.1f%% (%s hit(s), %s miss(es))", self.user_cache.hit_rate * 100, self.user_cache.hits, self.user_cache.misses)
+        if self.write_behind is not None:
+            self.write_behind.close()
+        self.pool.close()
+
+    def flush(self, raise_failures: bool = True):
+        if self.write_behind is not None:
+            self.write_behind.flush(raise_failures)
+
+    def commit(self):
+        if self._transaction_depth == 0:
+            with self.pool.writer_lock:
+                self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Group every write inside the block into a single commit; with write-behind, queued writes are already committed per batch."""
+        if self.write_behind is not None:
+            yield self
+            return
+        with self.pool.writer_lock:
+            self._transaction_depth += 1
+            self._transaction_thread = threading.get_ident()
+            try:
+                yield self
+            except Exception:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._transaction_thread = None
+                    self.connection.rollback()
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._transaction_thread = None
+                self.commit()
+
+    def execute(self, command: str, args: Any = ()):
+        with self.pool.writer_lock:
+            self.cursor.execute(command, args)
+            self.commit()
+
+    def fetch_one(self, command: str, args: Any = ()) -> Optional[tuple]:
+        if self._transaction_thread == threading.get_ident():
+            return self.connection.execute(command, args).fetchone()
+        with self.pool.reader() as connection:
+            return connection.execute(command, args).fetchone()
+
+    def fetch_all(self, command: str, args: Any = ()) -> List[tuple]:
+        if self._transaction_thread == threading.get_ident():
+            return self.connection.execute(command, args).fetchall()
+        with self.pool.reader() as connection:
+            return connection.execute(command, args).fetchall()
+
+    def fetch_records(self, command: str, args: Any = ()) -> List[dict]:
+        """Fetch rows as dicts keyed by the column names of the result, independent of the schema's column order."""
+        if self._transaction_thread == threading.get_ident():
+            cursor = self.connection.execute(command, args)
+            return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
+        with self.pool.reader() as connection:
+            cursor = connection.execute(command, args)
+            return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
+
+    async def run_in_pool(self, function: Callable, *args) -> Any:
+        """Run a blocking read method on the reader thread pool without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.pool.executor, function, *args)
 
     # Create #
     def create_table(self, table_name: str, column_def: str, foreign_key_def: str = None):
         command = f"CREATE TABLE IF NOT EXISTS {table_name} ({column_def})"
         if foreign_key_def is not None:
             command = command.rstrip(")") + ", {})".format(foreign_key_def)
-        self.cursor.execute(command)
-        self.connection.commit()
+        self.execute(command)
 
     def add_row(self, table_name: str, column_values: dict):
+        key_column = self.schema_get_key_column(table_name)
+        if self.write_behind is not None and key_column in column_values:
+            self.write_behind.insert(table_name, key_column, column_values)
+            return
         columns = ", ".join(column_values.keys())
         placeholders = ", ".join([":" + key for key in column_values.keys()])
         command = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-        self.cursor.execute(command, column_values)
-        self.connection.commit()
+        self.execute(command, column_values)
 
     def add_user(self, column_values: dict):
+        if isinstance(column_values["roles"], str):
+            column_values["roles"] = Role.mask_from_names(column_values["roles"].split(","))
+        column_values["roles"] = int(column_values["roles"])
         self.add_row("users", column_values)
-        self.logger.log(Debug.DATABASE, f"Added user '{column_values['client_id']}': (name={column_values['usernames']}, roles={column_values['roles']})")
+        self.user_cache.put(column_values["client_id"], dict(column_values))
+        self.logger.log(Debug.DATABASE, "Added user '%s': (roles=%r)", column_values["client_id"], column_values["roles"])
+
+    def add_username(self, column_values: dict):
+        """Record that a user went by a name: inserts it into the history, or only bumps ``last_seen`` if it is already known."""
+        now = sqliteutils.datetime_to_string()
+        column_values = {"first_seen": now, "last_seen": now, **column_values, "name_folded": column_values["name"].casefold()}
+        key_columns, update_columns = ("client_id", "name"), ("last_seen",)
+        if self.write_behind is not None:
+            self.write_behind.upsert("usernames", key_columns, column_values, update_columns)
+            return
+        self.execute(*upsert_statement("usernames", key_columns, column_values, update_columns))
 
     def add_midi(self, column_values: dict):
         self.add_row("midis", column_values)
-        self.logger.log(Debug.DATABASE, f"Added MIDI '{column_values['filename']}': ({', '.join(['{}={}'.format(key, value) for key, value in column_values.items()])})")
+        self.midi_index.add(column_values["filename"])
+        self.logger.log(Debug.DATABASE, "Added MIDI '%s': (%s)", column_values["filename"], KeyValues(column_values))
 
     # Read #
     def table_exists(self, table_name: str) -> bool:
         command = f"SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?"
-        args = [(table_name,)]
-        self.cursor.execute(command, *args)
-        return True if self.cursor.fetchone() is not None else False
+        args = (table_name,)
+        return True if self.fetch_one(command, args) is not None else False
 
     def user_exists(self, client_id: str) -> bool:
-        command = "SELECT * FROM users WHERE client_id = ?"
-        args = [(client_id,)]
-        self.cursor.execute(command, *args)
-        return True if self.cursor.fetchone() is not None else False
+        return self.get_user_record(client_id) is not None
 
     def get_user_row_dict(self, row_id: int) -> Optional[dict]:
+        self.flush(raise_failures=False)
         command = "SELECT * FROM users WHERE id = ?"
-        args = [(row_id,)]
-        self.cursor.execute(command, *args)
-        result = self.cursor.fetchone()
+        args = (row_id,)
+        result = self.fetch_one(command, args)
         return self.row_to_dict("users", result) if result is not None else None
 
+    def get_user_record(self, client_id: str) -> Optional[dict]:
+        """The user's row as a dict, served from the user cache; ``None`` if the user does not exist."""
+        record = self.user_cache.get(client_id)
+        if record is LRUCache.MISSING:
+            record = self.load_user_records([client_id])[client_id]
+        return record
+
+    def load_user_records(self, client_ids: List[str]) -> Dict[str, Optional[dict]]:
+        """Read users in a single query, overlay their queued writes and cache them, including the ones that do not exist."""
+        if self.write_behind is not None and any(self.write_behind.lookup("users", client_id) is not None for client_id in client_ids):
+            self.flush(raise_failures=False)
+        command = f"SELECT * FROM users WHERE client_id IN ({', '.join(['?'] * len(client_ids))})"
+        records = dict.fromkeys(client_ids)
+        records.update((record["client_id"], record) for record in self.fetch_records(command, client_ids))
+        return {client_id: self.user_cache.setdefault(client_id, record) for client_id, record in records.items()}
+
     def get_user_column(self, client_id: str, column_name: str) -> Optional[Any]:
-        if self.user_exists(client_id):
-            command = f"SELECT {column_name} FROM users WHERE client_id = ?"
-            args = [(client_id,)]
-            self.cursor.execute(command, *args)
-        else:
+        record = self.get_user_record(client_id)
+        if record is None:
             raise KeyError(f"User with client_id '{client_id}' does not exist")
-        result = self.cursor.fetchone()
+        if column_name not in record:
+            # Records cached by add_user lack the columns the database fills in, such as the row id
+            self.user_cache.invalidate(client_id)
+            record = self.load_user_records([client_id])[client_id]
+        return record[column_name]
+
+    def get_users_column(self, client_ids: Iterable[str], column_name: str) -> Dict[str, Any]:
+        """Fetch one column for many users, querying only the uncached ones; users that do not exist are absent from the result."""
+        records = {}
+        uncached = []
+        for client_id in client_ids:
+            record = self.user_cache.get(client_id)
+            if record is LRUCache.MISSING:
+                uncached.append(client_id)
+            else:
+                records[client_id] = record
+        if uncached:
+            records.update(self.load_user_records(uncached))
+        return {client_id: record[column_name] if column_name in record else self.get_user_column(client_id, column_name) for client_id, record in records.items() if record is not None}
+
+    def get_user_latest_username(self, client_id: str) -> Optional[str]:
+        self.flush(raise_failures=False)
+        command = "SELECT name FROM usernames WHERE client_id = ? ORDER BY last_seen DESC, id DESC LIMIT 1"
+        args = (client_id,)
+        result = self.fetch_one(command, args)
         return result[0] if result is not None else None
 
-    def get_user_latest_username(self, client_id: str) -> str:
-        usernames = self.get_user_column(client_id, "usernames")
-        return usernames.split("\0")[-1]
+    def get_usernames(self, client_id: str) -> List[str]:
+        """Every name the user has gone by, oldest first."""
+        self.flush(raise_failures=False)
+        command = "SELECT name FROM usernames WHERE client_id = ? ORDER BY first_seen, id"
+        args = (client_id,)
+        return [row[0] for row in self.fetch_all(command, args)]
 
-    def get_user_roles(self, client_id: str) -> Optional[List[Role]]:
-        result = self.get_user_column(client_id, "roles")
-        return [Role.from_name(role) for role in result.split(",")] if result is not None else None
+    def find_users_by_name(self, name: str, prefix: bool = False) -> List[str]:
+        """Client ids of the users who have gone by ``name`` (case-insensitively), most recently seen first."""
+        self.flush(raise_failures=False)
+        name_folded = name.casefold()
+        if prefix and name_folded:
+            condition, args = "name_folded >= ? AND name_folded < ?", (name_folded, sqliteutils.prefix_upper_bound(name_folded))
+        else:
+            condition, args = "name_folded = ?", (name_folded,)
+        command = f"SELECT client_id FROM usernames WHERE {condition} GROUP BY client_id ORDER BY MAX(last_seen) DESC"
+        return [row[0] for row in self.fetch_all(command, args)]
+
+    def get_user_role_mask(self, client_id: str) -> RoleFlag:
+        return RoleFlag(self.get_user_column(client_id, "roles") or 0)
+
+    def get_user_roles(self, client_id: str) -> List[Role]:
+        return Role.from_mask(self.get_user_role_mask(client_id))
 
     def get_midi_filenames(self) -> list[str]:
         command = "SELECT filename FROM midis"
-        self.cursor.execute(command)
-        result = self.cursor.fetchall()
-        return [row[0] for row in result]
+        result = [row[0] for row in self.fetch_all(command)]
+        if self.write_behind is not None:
+            result.extend(filename for filename in self.write_behind.pending_keys("midis") if filename not in result)
+        return result
+
+    def get_midi_hash(self, filename: str) -> Optional[str]:
+        self.flush(raise_failures=False)
+        command = "SELECT sha256 FROM midis WHERE filename = ?"
+        args = (filename,)
+        result = self.fetch_one(command, args)
+        return result[0] if result is not None else None
+
+    def count_midi_references(self, sha256: str) -> int:
+        """How many names point at the stored MIDI, so it can be deleted once nothing refers to it."""
+        self.flush(raise_failures=False)
+        command = "SELECT COUNT(*) FROM midis WHERE sha256 = ?"
+        args = (sha256,)
+        return self.fetch_one(command, args)[0]
+
+    async def read_users(self, client_ids: List[str], column_name: Optional[str], function: Callable, *args) -> Any:
+        """
+        Answer cached users inline and only hop to the reader pool when some of them have to be queried.
+
+        With ``column_name``, a cached record only counts if it has that column; records cached by ``add_user`` lack
+        the ones the database fills in, and reading those is a query too.
+        """
+        for client_id in client_ids:
+            record = self.user_cache.peek(client_id)
+            if record is LRUCache.MISSING or (record is not None and column_name is not None and column_name not in record):
+                return await self.run_in_pool(function, *args)
+        return function(*args)
+
+    def search_midis(self, query: str, limit: int = None) -> List[str]:
+        return self.midi_index.search(query, limit)
+
+    async def user_exists_async(self, client_id: str) -> bool:
+        return await self.read_users([client_id], None, self.user_exists, client_id)
+
+    async def get_user_column_async(self, client_id: str, column_name: str) -> Optional[Any]:
+        return await self.read_users([client_id], column_name, self.get_user_column, client_id, column_name)
+
+    async def get_users_column_async(self, client_ids: Iterable[str], column_name: str) -> Dict[str, Any]:
+        client_ids = list(client_ids)
+        return await self.read_users(client_ids, column_name, self.get_users_column, client_ids, column_name)
+
+    async def get_user_role_mask_async(self, client_id: str) -> RoleFlag:
+        return await self.read_users([client_id], "roles", self.get_user_role_mask, client_id)
+
+    async def get_user_roles_async(self, client_id: str) -> List[Role]:
+        return await self.read_users([client_id], "roles", self.get_user_roles, client_id)
+
+    async def get_user_latest_username_async(self, client_id: str) -> Optional[str]:
+        return await self.run_in_pool(self.get_user_latest_username, client_id)
+
+    async def find_users_by_name_async(self, name: str, prefix: bool = False) -> List[str]:
+        return await self.run_in_pool(self.find_users_by_name, name, prefix)
+
+    async def get_midi_filenames_async(self) -> list[str]:
+        return await self.run_in_pool(self.get_midi_filenames)
+
+    async def get_midi_hash_async(self, filename: str) -> Optional[str]:
+        return await self.run_in_pool(self.get_midi_hash, filename)
+
+    async def count_midi_references_async(self, sha256: str) -> int:
+        return await self.run_in_pool(self.count_midi_references, sha256)
 
     # Update #
+    def update_row(self, table_name: str, key_column: str, key: Any, column_values: dict):
+        if self.write_behind is not None:
+            self.write_behind.update(table_name, key_column, key, column_values)
+            return
+        command = f"UPDATE {table_name} SET {', '.join([f'{column} = ?' for column in column_values])} WHERE {key_column} = ?"
+        args = list(column_values.values()) + [key]
+        self.execute(command, args)
+
     def update_user(self, client_id: str, column_values: dict):
-        command = f"UPDATE users SET {', '.join([f'{column} = ?' for column in column_values])} WHERE client_id = ?"
-        args = list(column_values.values()) + [client_id]
-        self.cursor.execute(command, args)
-        self.connection.commit()
-        self.logger.log(Debug.DATABASE, f"Updated user '{client_id}': ({', '.join(['{}={}'.format(key, value) for key, value in column_values.items()])})")
+        self.update_row("users", "client_id", client_id, column_values)
+        record = self.user_cache.peek(client_id)
+        if record is LRUCache.MISSING or record is None:
+            self.user_cache.invalidate(client_id)
+        else:
+            self.user_cache.put(client_id, {**record, **column_values})
+        self.logger.log(Debug.DATABASE, "Updated user '%s': (%s)", client_id, KeyValues(column_values))
 
     def update_midi(self, filename: str, column_values: dict):
-        command = f"UPDATE midis SET {', '.join([f'{column} = ?' for column in column_values])} WHERE filename = ?"
-        args = list(column_values.values()) + [filename]
-        self.cursor.execute(command, args)
-        self.connection.commit()
-        self.logger.log(Debug.DATABASE, f"Updated MIDI '{filename}': ({', '.join(['{}={}'.format(key, value) for key, value in column_values.items()])})")
+        self.update_row("midis", "filename", filename, column_values)
+        if column_values.get("filename", filename) != filename:
+            self.midi_index.rename(filename, column_values["filename"])
+        self.logger.log(Debug.DATABASE, "Updated MIDI '%s': (%s)", filename, KeyValues(column_values))
 
     # Delete #
     def drop_table(self, table_name: str):
         command = f"DROP TABLE {table_name}"
-        self.cursor.execute(command)
-        self.connection.commit()
+        self.execute(command)
+        if table_name == "users":
+            self.user_cache.clear()
 
     # Misc #
     def row_to_dict(self, table: str, row: tuple) -> dict:
@@ -140,6 +460,15 @@ class DatabaseManager:
             row_dict[column["column_name"]] = row[index]
         return row_dict
 
+    def schema_get_key_column(self, table_name: str) -> Optional[str]:
+        table = self.schema_get_table(table_name)
+        if table is None:
+            return None
+        for column in table["columns"]:
+            if column.get("unique"):
+                return column["column_name"]
+        return None
+
     def schema_get_table(self, table_name: str) -> Optional[dict]:
         for table in self.schema["tables"]:
             if table["name"] == table_name:
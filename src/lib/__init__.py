@@ -1,9 +1,28 @@
 from .logger import Logger
-from .message import MPPMessage
+from .log_sink import LogSink
+from .metrics import Metrics, MetricsServer
+from .scheduler import Scheduler, ScheduledTask
+from .downloader import Downloader
+from .message import MPPMessage, InboundMessage, ChatMessage, DirectMessage, VerifyMessage, DisconnectMessage, ChatHistoryMessage, ChannelInfoMessage, CustomMessage, ConnectMessage, RoomListMessage, MouseMessage, NotesMessage, NotificationMessage, NoteQuotaMessage, ParticipantMessage, PongMessage, UnknownMessage
 from .tag import Tag
 from .vector import Vector2D
 from .participant import Participant
+from .participant_store import ParticipantStore
 from .command import CommandMessage
 from .debug import Debug
+from .midi import Midi, MidiLimits
+from .midi_store import MidiStore, MappedMidi
+from .player import MidiPlayer
+from .quota import NoteQuota
+from .timesync import TimeSync
+from .scoring import ScoringEngine, PlayerScore
+from .message_queue import MessageQueue, QueuePolicy
+from .dispatch import DispatchTable, ConcurrentDispatcher, HandlerJob, handles, noop
 
-__all__ = ["Logger", "MPPMessage", "Participant", "Tag", "Vector2D", "CommandMessage", "Debug"]
+__all__ = [
+    "Logger", "LogSink", "Metrics", "MetricsServer", "Scheduler", "ScheduledTask", "Downloader", "MPPMessage", "Participant", "ParticipantStore", "Tag", "Vector2D", "CommandMessage", "Debug", "Midi", "MidiLimits", "MidiStore", "MappedMidi", "MidiPlayer", "NoteQuota", "TimeSync",
+    "ScoringEngine", "PlayerScore", "MessageQueue", "QueuePolicy", "DispatchTable", "ConcurrentDispatcher", "HandlerJob", "handles", "noop",
+    "InboundMessage", "ChatMessage", "DirectMessage", "VerifyMessage", "DisconnectMessage", "ChatHistoryMessage", "ChannelInfoMessage",
+    "CustomMessage", "ConnectMessage", "RoomListMessage", "MouseMessage", "NotesMessage", "NotificationMessage", "NoteQuotaMessage",
+    "ParticipantMessage", "PongMessage", "UnknownMessage"
+]
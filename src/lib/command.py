@@ -1,4 +1,3 @@
-from typing import Optional, Any, Tuple, Generator
 from src.commands import Command
 from src.lib.exceptions import *
 
@@ -32,88 +31,55 @@ class CommandMessage:
 
     @classmethod
     def deserialize(cls, message: str) -> "CommandMessage":
+        """
+        Tokenize and parse a prefixed chat message in one pass over its segments.
+
+        A segment is an argument unless it starts with "-" or follows a value-taking option; options after a trailing
+        argument are part of that argument. Argument errors take precedence over option errors, which are raised once
+        every segment has been seen.
+        """
         segments = message[1:].split()
         command = Command.from_name(segments.pop(0))
-        arg_generator = cls.argument_parser(segments, command)
-        opt_generator = cls.options_parser(segments, command)
-        args = {key: value for key, value in arg_generator}
-        opts = {key: value for key, value in opt_generator}
-        return cls(command, args, opts)
-
-    @classmethod
-    def argument_parser(cls, segments: list, command: Command) -> Generator[Tuple[str, Any], None, Optional[str]]:
-        if not command.args:
-            return "Nothing to parse"
+        grammar = command.grammar
+        args = {}
+        opts = {}
         arg_index = 0
-        for i, arg in enumerate(segments):
-            if cls.is_argument(i, arg, segments, command, arg_index):
-                argument_name = command.get_arg_name(arg_index)
-                argument_type = command.get_arg_type(arg_index)
-                is_trailing = command.args[arg_index]["trailing"]
-                try:
-                    arg_index += 1
-                    if not is_trailing:
-                        value = argument_type(arg)
-                    else:
-                        value = argument_type(" ".join(segments[i:]))
-                    yield argument_name, value
-                except ValueError:
-                    raise ArgumentValueError(arg, argument_type)
-
-    @classmethod
-    def options_parser(cls, segments: list, command: Command) -> Generator[Tuple[str, Optional[Any]], None, Optional[str]]:
-        if not command.opts:
-            return "Nothing to parse"
-        arg_index = 0
-        opt_index = 0
+        opt_count = 0
         trailing_index = None
-        for i, arg in enumerate(segments):
-            if cls.is_option(i, arg, command, opt_index, trailing_index):
-                character = arg[1:]
-                option_name = command.get_opt_name(character)
-                option_type = command.get_opt_type(character)
-                if option_type is not bool:
-                    if i + 1 < len(segments) and not segments[i + 1].startswith("-"):
-                        value = option_type(segments[i + 1])
+        option_error = None
+        for i, segment in enumerate(segments):
+            if segment.startswith("-"):
+                character = segment[1:]
+                if (
+                    option_error is None
+                    and character in grammar.opt_chars
+                    and opt_count < len(command.opts)
+                    and (trailing_index is None or i <= trailing_index)
+                ):
+                    opt_count += 1
+                    option_name = grammar.opt_names[character]
+                    option_type = grammar.opt_types[character]
+                    if option_type is bool:
+                        opts[option_name] = True
+                    elif i + 1 < len(segments) and not segments[i + 1].startswith("-"):
+                        try:
+                            opts[option_name] = option_type(segments[i + 1])
+                        except ValueError as e:
+                            option_error = e
                     else:
-                        raise OptionMissingError(option_name)
+                        option_error = OptionMissingError(option_name)
+            elif arg_index < len(grammar.arg_names) and (i == 0 or not segments[i - 1].startswith("-") or segments[i - 1][1:] not in grammar.value_opt_chars):
+                argument_type = grammar.arg_types[arg_index]
+                if grammar.arg_trailing[arg_index]:
+                    trailing_index = i
+                    value = " ".join(segments[i:])
                 else:
-                    value = True
+                    value = segment
                 try:
-                    opt_index += 1
-                    yield option_name, value
+                    args[grammar.arg_names[arg_index]] = argument_type(value)
                 except ValueError:
-                    raise OptionValueError((character, segments[i + 1]), option_type)
-            elif cls.is_argument(i, arg, segments, command, arg_index):
-                if command.args[arg_index]["trailing"]:
-                    trailing_index = i
+                    raise ArgumentValueError(segment, argument_type)
                 arg_index += 1
-
-    @staticmethod
-    def is_argument(i: int, arg: str, segments: list, command: Command, arg_index: int) -> bool:
-        return (
-            not arg.startswith("-")
-            and (
-                i == 0
-                or (i != 0 and not segments[i - 1].startswith("-"))
-                or (segments[i - 1].startswith("-") and segments[i - 1][1:] not in command.opt_chars)
-                or (segments[i - 1].startswith("-") and segments[i - 1][1:] in command.opt_chars and command.get_opt_type(segments[i - 1][1:]) is bool)
-            )
-            and arg_index < len(command.args)
-        )
-
-    @staticmethod
-    def is_option(i: int, arg: str, command: Command, opt_index: int, trailing_index: Optional[int]) -> bool:
-        return (
-            (
-                arg.startswith("-")
-                and len(arg) > 1
-                and arg[1:] in command.opt_chars
-                and opt_index < len(command.opts)
-            ) and (
-                False if (
-                    trailing_index is not None
-                    and i > trailing_index
-                ) else True
-            )
-        )
+        if option_error is not None:
+            raise option_error
+        return cls(command, args, opts)
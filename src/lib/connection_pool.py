@@ -0,0 +1,45 @@
+import sqlite3, threading, queue, pathlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class ConnectionPool:
+    """
+    One writer connection plus a pool of read-only connections to a WAL-mode SQLite database.
+
+    In WAL mode readers see the last committed state without waiting on the writer, so queries can run on the
+    ``executor`` threads concurrently with writes. Every use of the writer connection must hold ``writer_lock``.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, timeout: float = 5.0):
+        self.db_path = db_path
+        self.size = readers
+        self.writer = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.writer_lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix=self.__class__.__name__)
+
+        self._readers = queue.Queue()
+        uri = pathlib.Path(db_path).as_uri() + "?mode=ro"
+        for _ in range(readers):
+            self._readers.put(sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False))
+
+    def __str__(self):
+        return f"ConnectionPool Object: (db_path={self.db_path}, readers={self.size}, idle={self._readers.qsize()})"
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        connection = self._readers.get()
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for _ in range(self.size):
+            self._readers.get().close()
+        with self.writer_lock:
+            self.writer.close()
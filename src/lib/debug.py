@@ -9,6 +9,7 @@ class Debug(Enum):
     INBOUND = 4
     OUTBOUND = 8
     FILESYSTEM = 16
+    PLAYBACK = 32
 
     @staticmethod
     def from_string(debug: str) -> int:
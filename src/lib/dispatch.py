@@ -0,0 +1,190 @@
+import asyncio
+from collections import deque
+from typing import Dict, Callable, Any, FrozenSet, Hashable, Iterable, Optional, Deque, Tuple
+from src.lib.message import MPPMessage
+from src.lib.exceptions import HandlerTimeoutError
+
+
+def handles(message_type: MPPMessage.ClientBound) -> Callable:
+    """Register the decorated coroutine as the handler for ``message_type`` regardless of its name."""
+    def decorator(function: Callable) -> Callable:
+        function.__handles__ = message_type
+        return function
+    return decorator
+
+
+def noop(function: Callable) -> Callable:
+    """Mark the decorated handler as optional; messages it would receive are not decoded unless a subclass overrides it."""
+    function.__noop__ = True
+    return function
+
+
+class DispatchTable:
+    """
+    Maps each wire ``m`` string of ``MPPMessage.ClientBound`` to the name of the method that handles it.
+
+    The table is resolved once per class, so dispatching a message is a single dictionary lookup on the bound handlers.
+    """
+
+    def __init__(self, handlers: Dict[str, str]):
+        self.handlers = handlers
+
+    def __str__(self):
+        return f"DispatchTable Object: ({', '.join(['{}={}'.format(m, name) for m, name in self.handlers.items()])})"
+
+    @classmethod
+    def build(cls, owner: type) -> "DispatchTable":
+        handlers = {}
+        for member in MPPMessage.ClientBound:
+            name = f"handle_{member.m}_message"
+            if callable(getattr(owner, name, None)):
+                handlers[member.m] = name
+        for klass in reversed(owner.__mro__):
+            for name, attribute in vars(klass).items():
+                message_type = getattr(attribute, "__handles__", None)
+                if message_type is not None:
+                    handlers[message_type.m] = name
+        return cls(handlers)
+
+    def resolve(self, owner: type, m: str) -> Optional[Callable]:
+        """The unbound function that handles ``m`` on ``owner``, to tell whether a subclass replaced a base handler."""
+        name = self.handlers.get(m)
+        return getattr(owner, name) if name is not None else None
+
+    def active(self, owner: type) -> FrozenSet[str]:
+        """Wire ``m`` strings whose handler on ``owner`` does actual work."""
+        return frozenset(m for m, name in self.handlers.items() if not getattr(getattr(owner, name), "__noop__", False))
+
+    def bind(self, instance: Any) -> Dict[str, Callable]:
+        return {m: getattr(instance, name) for m, name in self.handlers.items()}
+
+
+class HandlerJob:
+    __slots__ = ("handler", "args", "name", "after", "done")
+
+    def __init__(self, handler: Callable, args: Tuple[Any, ...], name: str, after: Tuple[asyncio.Future, ...], done: asyncio.Future):
+        self.handler = handler
+        self.args = args
+        self.name = name
+        self.after = after
+        self.done = done
+
+    def __str__(self):
+        return f"HandlerJob Object: (name={self.name}, after={len(self.after)}, done={self.done.done()})"
+
+
+class HandlerLane:
+    __slots__ = ("key", "jobs", "task", "tail")
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.jobs: Deque[HandlerJob] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.tail: Optional[asyncio.Future] = None
+
+    def __str__(self):
+        return f"HandlerLane Object: (key={self.key}, queued={len(self.jobs)}, running={self.task is not None and not self.task.done()})"
+
+
+class ConcurrentDispatcher:
+    """
+    Runs handler coroutines as tasks, in order within a lane and concurrently across lanes.
+
+    Every job is submitted to a lane key; each lane has a single task draining it front to back, so jobs sharing a key
+    never overlap or reorder, while at most ``concurrency`` jobs of all lanes run at once. A job can also wait for the
+    jobs already submitted to other lanes (``after``) to finish first. Jobs taking longer than ``timeout`` seconds are
+    cancelled and reported to ``on_error`` as a ``HandlerTimeoutError``, like any exception they raise, and ``submit``
+    waits once ``max_pending`` jobs are queued or running, so a flood of messages backs up in the inbound queue instead
+    of in memory here.
+    """
+
+    def __init__(self, concurrency: int = 8, timeout: Optional[float] = None, max_pending: int = 256, on_error: Optional[Callable[[HandlerJob, BaseException], Any]] = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.lanes: Dict[Hashable, HandlerLane] = {}
+        self.pending = 0
+        self.running = 0
+        self.timeouts = 0
+        self.failures = 0
+
+        self._slots = asyncio.Semaphore(concurrency)
+        self._capacity = asyncio.Semaphore(max_pending)
+
+    def __str__(self):
+        return f"ConcurrentDispatcher Object: (lanes={len(self.lanes)}, pending={self.pending}, running={self.running}/{self.concurrency}, timeouts={self.timeouts}, failures={self.failures})"
+
+    def __len__(self):
+        return self.pending
+
+    async def submit(self, key: Hashable, handler: Callable, *args: Any, name: Optional[str] = None, after: Iterable[Hashable] = ()) -> asyncio.Future:
+        """Queue ``handler(*args)`` on lane ``key`` and return a future that resolves once it has finished, failed or been cancelled."""
+        await self._capacity.acquire()
+        waits_for = tuple(self.lanes[other].tail for other in after if other != key and other in self.lanes)
+        job = HandlerJob(handler, args, name or handler.__name__, waits_for, asyncio.get_running_loop().create_future())
+        self.pending += 1
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = HandlerLane(key)
+            lane.task = asyncio.create_task(self.drain(lane), name=f"{self.__class__.__name__}[{key}]")
+        lane.jobs.append(job)
+        lane.tail = job.done
+        return job.done
+
+    async def drain(self, lane: HandlerLane):
+        try:
+            while lane.jobs:
+                job = lane.jobs[0]
+                try:
+                    await self.execute(job)
+                finally:
+                    lane.jobs.popleft()
+                    self.finish(job)
+        finally:
+            # Only reached with jobs left when the lane was cancelled
+            while lane.jobs:
+                self.finish(lane.jobs.popleft())
+            if self.lanes.get(lane.key) is lane:
+                del self.lanes[lane.key]
+
+    async def execute(self, job: HandlerJob):
+        if job.after:
+            await asyncio.wait(job.after)
+        async with self._slots:
+            self.running += 1
+            try:
+                await asyncio.wait_for(job.handler(*job.args), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.report(job, HandlerTimeoutError(job.name, self.timeout))
+            except Exception as e:
+                self.failures += 1
+                self.report(job, e)
+            finally:
+                self.running -= 1
+
+    def finish(self, job: HandlerJob):
+        if not job.done.done():
+            job.done.set_result(None)
+        self.pending -= 1
+        self._capacity.release()
+
+    def report(self, job: HandlerJob, error: BaseException):
+        if self.on_error is not None:
+            self.on_error(job, error)
+
+    def cancel(self, key: Optional[Hashable] = None):
+        """Drop the queued jobs of lane ``key`` (or of every lane) and cancel the one that is running."""
+        lanes = list(self.lanes.values()) if key is None else [self.lanes[key]] if key in self.lanes else []
+        for lane in lanes:
+            lane.task.cancel()
+
+    async def join(self):
+        """Wait until every job submitted so far has finished."""
+        while self.lanes:
+            await asyncio.wait([lane.task for lane in self.lanes.values()])
+
+    async def close(self):
+        self.cancel()
+        await self.join()
@@ -0,0 +1,142 @@
+import asyncio, os, socket, tempfile, threading, time, requests
+from typing import Optional, Callable
+from src.lib.exceptions import HTTPError, DownloadError
+
+
+class Downloader:
+    """
+    Streams files over HTTP into a directory without blocking the event loop.
+
+    Each download runs on a worker thread and writes the body in ``chunk_size`` pieces to a temporary file in the
+    target directory, which is renamed over a destination of its own only once it is complete, so readers never see a
+    partial file and concurrent downloads of the same name never share one. Downloads are aborted once the body exceeds
+    ``max_size`` bytes or the whole transfer exceeds ``timeout`` seconds, and at most ``concurrency`` of them run at
+    the same time.
+    """
+
+    def __init__(self, directory: str, max_size: int, timeout: float, concurrency: int = 2, chunk_size: int = 64 * 1024, progress_interval: float = 2.0):
+        self.directory = directory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def __str__(self):
+        return f"Downloader Object: (directory={self.directory}, max_size={self.max_size}, timeout={self.timeout}, concurrency={self.concurrency})"
+
+    async def download(self, url: str, filename: str, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> str:
+        """
+        Download ``url`` into the directory and return the path of the file, named after ``filename`` but unique.
+
+        ``progress(received, total)`` is called on the event loop at most every ``progress_interval`` seconds while the
+        transfer is running; ``total`` is ``None`` if the server did not send a length. Cancelling the download stops
+        the worker thread too, at the latest once the read it is blocked in is interrupted.
+        """
+        filename = os.path.basename(filename)
+        if not filename or filename in (".", ".."):
+            raise DownloadError(url, "invalid file name")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+
+        def report(received: int, total: Optional[int]):
+            if progress is not None:
+                loop.call_soon_threadsafe(progress, received, total)
+
+        async with self._semaphore:
+            try:
+                return await asyncio.to_thread(self.fetch, url, filename, report, stop)
+            except asyncio.CancelledError:
+                stop.set()
+                raise
+
+    def fetch(self, url: str, filename: str, report: Callable[[int, Optional[int]], None], stop: threading.Event) -> str:
+        """
+        Blocking part of ``download``. A watchdog thread shuts the connection down once ``stop`` is set or the deadline
+        passes, since ``requests`` only has a timeout per socket read and a server sending a byte at a time never hits it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        stem, extension = os.path.splitext(filename)
+        descriptor, destination = tempfile.mkstemp(prefix=f"{stem}.", suffix=extension, dir=self.directory)
+        os.close(descriptor)
+        descriptor, temporary_path = tempfile.mkstemp(prefix=f".{filename}.", suffix=".part", dir=self.directory)
+        finished = threading.Event()
+        aborted = threading.Event()
+        completed = False
+
+        def watch(sock: Optional[socket.socket]):
+            stop.wait(max(0.0, deadline - time.monotonic()))
+            # Keep shutting the socket down until the worker notices, in case a read was already under way
+            while not finished.is_set():
+                aborted.set()
+                abort(sock)
+                finished.wait(0.1)
+
+        def failure(e: Optional[Exception] = None) -> DownloadError:
+            if stop.is_set() and time.monotonic() < deadline:
+                return DownloadError(url, "cancelled")
+            if aborted.is_set() or time.monotonic() >= deadline:
+                return DownloadError(url, f"timed out after {self.timeout:g} seconds")
+            return DownloadError(url, type(e).__name__)
+
+        try:
+            with os.fdopen(descriptor, "wb") as file, requests.get(url, stream=True, timeout=min(self.timeout, 10.0)) as response:
+                threading.Thread(target=watch, args=(response_socket(response),), name=f"{self.__class__.__name__}-watchdog", daemon=True).start()
+                if response.status_code != 200:
+                    raise HTTPError(url, response.status_code)
+                length = response.headers.get("Content-Length")
+                total = int(length) if length is not None and length.isdigit() else None
+                if total is not None and total > self.max_size:
+                    raise DownloadError(url, f"file is {total} bytes, the limit is {self.max_size}")
+                received = 0
+                next_report = time.monotonic() + self.progress_interval
+                for chunk in response.iter_content(self.chunk_size):
+                    received += len(chunk)
+                    if received > self.max_size:
+                        raise DownloadError(url, f"file exceeds the limit of {self.max_size} bytes")
+                    now = time.monotonic()
+                    if stop.is_set() or now > deadline:
+                        raise failure()
+                    file.write(chunk)
+                    if now >= next_report:
+                        report(received, total)
+                        next_report = now + self.progress_interval
+                if aborted.is_set():
+                    # A body without a length just ends when the socket is shut down
+                    raise failure()
+                finished.set()
+            os.replace(temporary_path, destination)
+            completed = True
+        except requests.RequestException as e:
+            raise failure(e)
+        finally:
+            finished.set()
+            stop.set()
+            for path in (temporary_path, destination) if not completed else (temporary_path,):
+                if os.path.exists(path):
+                    os.remove(path)
+        return destination
+
+
+def response_socket(response: requests.Response) -> Optional[socket.socket]:
+    """The socket a streamed ``response`` is read from, taken right after the headers while it can still be found."""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is None:
+        # http.client detaches the socket from the connection of a close-delimited response; its file still holds it
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    return sock
+
+
+def abort(sock: Optional[socket.socket]):
+    """Interrupt a read blocked on ``sock``; closing the response alone does not wake the reading thread up."""
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
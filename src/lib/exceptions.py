@@ -8,7 +8,11 @@ __all__ = [
     "OptionMutualExclusivityError",
     "CommandAuthorizationError",
     "BotTermination",
-    "HTTPError"
+    "HTTPError",
+    "MidiParseError",
+    "DownloadError",
+    "HandlerTimeoutError",
+    "WriteBehindError"
 ]
 
 
@@ -72,3 +76,35 @@ class HTTPError(Exception):
         self.code = status_code
         self.error = f"**Error:** [Status Code: `{self.code}`] - Failed to retrieve webpage: *{self.url}*"
         super().__init__(self.error)
+
+
+class MidiParseError(Exception):
+    def __init__(self, filename: Optional[str], reason: str):
+        self.filename = filename
+        self.reason = reason
+        self.error = f"**Error:** Failed to parse MIDI file `{self.filename}`: {self.reason}" if self.filename is not None else f"**Error:** Failed to parse MIDI file: {self.reason}"
+        super().__init__(self.error)
+
+
+class DownloadError(Exception):
+    def __init__(self, url: str, reason: str):
+        self.url = url
+        self.reason = reason
+        self.error = f"**Error:** Failed to download *{self.url}*: {self.reason}"
+        super().__init__(self.error)
+
+
+class HandlerTimeoutError(Exception):
+    def __init__(self, handler_name: str, timeout: float):
+        self.handler_name = handler_name
+        self.timeout = timeout
+        self.error = f"**Error:** `{self.handler_name}` took longer than {self.timeout:g} seconds and was cancelled"
+        super().__init__(self.error)
+
+
+class WriteBehindError(Exception):
+    def __init__(self, reason: str, failed: List[Any] = None):
+        self.reason = reason
+        self.failed = failed or []
+        self.error = f"**Error:** Queued database writes failed: {self.reason}"
+        super().__init__(self.error)
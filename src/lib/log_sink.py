@@ -0,0 +1,154 @@
+import sys, copy, json, time, queue, threading, atexit
+from collections import deque
+from enum import Enum
+from typing import Optional, List, TextIO, Any, Dict
+
+# Argument types that cannot change between the log call and the sink thread formatting the record
+IMMUTABLE_TYPES = (str, int, float, bytes, type(None), Enum)
+
+
+class LogRecord:
+    """
+    One log event with its message arguments kept unformatted until it is written or dumped.
+
+    Immutable arguments are kept as they are, and objects with a ``log_snapshot()`` method (such as messages) are
+    replaced by the cheap copy it returns. A record with any other argument is formatted when it is created, and
+    mutable field values are copied, so the record shows the state at the time of the call even though the sink thread
+    writes it later.
+    """
+
+    __slots__ = ("created", "logger", "category", "message", "args", "fields")
+
+    def __init__(self, logger: str, category: str, message: Any, args: tuple, fields: Dict[str, Any]):
+        self.created = time.time()
+        self.logger = logger
+        self.category = category
+        self.message = message
+        self.args = args
+        self.fields = {key: value if isinstance(value, IMMUTABLE_TYPES) else snapshot(value) for key, value in fields.items()}
+        if isinstance(message, str) and all(isinstance(arg, IMMUTABLE_TYPES) or hasattr(arg, "log_snapshot") for arg in args):
+            self.args = tuple(arg if isinstance(arg, IMMUTABLE_TYPES) else arg.log_snapshot() for arg in args)
+        else:
+            self.message = self.format_message()
+            self.args = ()
+
+    def __str__(self):
+        return f"LogRecord Object: (logger={self.logger}, category={self.category}, message={self.message!r})"
+
+    def format_message(self) -> str:
+        message = str(self.message)
+        if self.args:
+            try:
+                message = message % self.args
+            except (TypeError, ValueError) as e:
+                message = f"{message} {self.args!r} (formatting failed: {e})"
+        return message.strip()
+
+    def as_dict(self) -> dict:
+        return {"time": self.created, "logger": self.logger, "category": self.category, "message": self.format_message(), **self.fields}
+
+    def render(self, structured: bool = False) -> str:
+        if structured:
+            return json.dumps(self.as_dict(), default=str)
+        fields = "".join(f" {key}={value}" for key, value in self.fields.items())
+        return f"[{self.logger} - {self.category}] {self.format_message()}{fields}"
+
+
+def snapshot(value: Any) -> Any:
+    try:
+        return copy.deepcopy(value)
+    except Exception:
+        return str(value)
+
+
+class KeyValues:
+    """Renders a mapping as ``key=value`` pairs, only once the record that holds it is formatted."""
+
+    __slots__ = ("mapping",)
+
+    def __init__(self, mapping: Dict[str, Any]):
+        self.mapping = dict(mapping)
+
+    def log_snapshot(self) -> "KeyValues":
+        return self
+
+    def __str__(self):
+        return ", ".join(f"{key}={value}" for key, value in self.mapping.items())
+
+
+class LogSink:
+    """
+    Writes log records from a background thread and keeps the most recent ones in a ring buffer.
+
+    ``emit`` only enqueues the record, so formatting and the blocking write happen off the caller's thread (usually the
+    event loop); the writer drains up to ``batch_size`` records per write. ``capture`` keeps records in memory whether
+    or not they are printed, so ``dump`` can reconstruct what happened before a crash.
+    """
+
+    _default: Optional["LogSink"] = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, stream: Optional[TextIO] = None, capacity: int = 1024, batch_size: int = 256, structured: bool = False):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.structured = structured
+        self.ring = deque(maxlen=capacity)
+
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self.run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def __str__(self):
+        return f"LogSink Object: (queued={self._queue.qsize()}, buffered={len(self.ring)}/{self.ring.maxlen}, structured={self.structured})"
+
+    @classmethod
+    def default(cls, **kwargs) -> "LogSink":
+        """The process-wide sink shared by every logger; the keyword arguments of the first call configure it."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(**kwargs)
+                atexit.register(cls._default.close)
+            return cls._default
+
+    def emit(self, record: LogRecord):
+        self._queue.put(record)
+
+    def capture(self, record: LogRecord):
+        self.ring.append(record)
+
+    def run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            lines = [self.render(record) for record in batch if record is not None]
+            if lines:
+                stream = self.stream or sys.stdout
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            if stopping:
+                break
+
+    def render(self, record: LogRecord) -> str:
+        try:
+            return record.render(self.structured)
+        except Exception as e:
+            return f"[{record.logger} - {record.category}] {record.message!r} (rendering failed: {e!r})"
+
+    def close(self, timeout: float = 5.0):
+        """Write everything queued so far and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def dump(self, path: Optional[str] = None) -> List[str]:
+        """Render the buffered records, oldest first, and optionally write them to ``path``."""
+        lines = [self.render(record) for record in list(self.ring)]
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+        return lines
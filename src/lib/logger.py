@@ -1,11 +1,42 @@
+from typing import Optional, Any
 from .debug import Debug
+from .log_sink import LogSink, LogRecord
 
 
 class Logger:
-    def __init__(self, name: str, debug: int):
+    """
+    Category-filtered logger with deferred formatting.
+
+    ``log`` takes printf-style arguments and keyword fields instead of a preformatted string, so a disabled category
+    costs a mask check and nothing is formatted on the caller's thread. Every record is kept in the sink's ring buffer
+    for post-mortem dumps, and records of the ``capture`` categories (and errors) are kept there even when not printed.
+    """
+
+    def __init__(self, name: str, debug: int, capture: int = 0, sink: Optional[LogSink] = None):
         self.name = name
         self.debug = debug
+        self.capture = capture
+        self.sink = sink if sink is not None else LogSink.default()
+
+    def enabled(self, debug_type: Debug) -> bool:
+        return bool(self.debug & debug_type.value) and not self.debug < 0
+
+    def captured(self, debug_type: Debug) -> bool:
+        return debug_type is Debug.ERROR or bool(self.capture & debug_type.value)
+
+    def active(self, debug_type: Debug) -> bool:
+        """Whether a record of this category would be printed or captured, to skip building log arguments in hot loops."""
+        return self.enabled(debug_type) or self.captured(debug_type)
+
+    def log(self, debug_type: Debug, data: Any, *args: Any, **fields: Any):
+        enabled = self.enabled(debug_type)
+        captured = self.captured(debug_type)
+        if not enabled and not captured:
+            return
+        record = LogRecord(self.name, debug_type.name, data, args, fields)
+        self.sink.capture(record)
+        if enabled:
+            self.sink.emit(record)
 
-    def log(self, debug_type: Debug, data: str):
-        if self.debug & debug_type.value and not self.debug < 0:
-            print(f"[{self.name} - {debug_type.name}] {str(data).strip()}")
+    def dump(self, path: Optional[str] = None) -> list[str]:
+        return self.sink.dump(path)
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Dict
+
+
+class LRUCache:
+    """Thread-safe mapping bounded to ``capacity`` entries that evicts the least recently used one and counts hits."""
+
+    MISSING = object()
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"LRUCache Object: (size={len(self)}, capacity={self.capacity}, hits={self.hits}, misses={self.misses}, hit_rate={self.hit_rate:.1%})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Look up ``key`` without touching its recency or the hit counters."""
+        return self._entries.get(key, default)
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        """Insert ``value`` unless ``key`` is already cached, so a slow load never overwrites a newer write."""
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            self._entries[key] = value
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return value
+
+    def update(self, entries: Dict[Hashable, Any]):
+        for key, value in entries.items():
+            self.put(key, value)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
@@ -1,9 +1,10 @@
-import json, re
+import json
 from enum import Enum
-from typing import Union, Any, List, Optional
+from typing import Union, Any, List, Optional, Dict, Tuple, FrozenSet
 
 
 class MPPMessage:
+    __slots__ = ("type", "payload")
 
     class ServerBound(Enum):
         MESSAGE = "a", {"message": str}, {"reply_to": str}
@@ -62,51 +63,211 @@ class MPPMessage:
     def __str__(self):
         return f"MPPMessage Object: (type={self.type}, {', '.join(['{}={}'.format(key, value) for key, value in self.payload.items()])})"
 
+    def log_snapshot(self) -> "MPPMessage":
+        """Copy of the message for a log record formatted later; the payload is copied, its values are shared."""
+        return MPPMessage(self.type, **self.payload)
+
     def serialize(self) -> dict:
         json_msg = {key: value for key, value in self.payload.items()}
         json_msg["m"] = self.type.m
         return json_msg
 
-    def search(self, pattern, obj=None) -> Optional[str]:
-        if obj is None:
-            obj = self.payload
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                result = self.search(pattern, value)
-                if result:
-                    return result
-        elif isinstance(obj, list):
-            for item in obj:
-                result = self.search(pattern, item)
-                if result:
-                    return result
-        else:
-            if isinstance(obj, str):
-                match = re.search(pattern, obj)
-                if match:
-                    return str(match.group())
-        return None
-
     @classmethod
-    def deserialize(cls, data: str) -> List["MPPMessage"]:
+    def deserialize(cls, data: str, accept: Optional[FrozenSet[str]] = None) -> List["MPPMessage"]:
+        """
+        Decode a frame into typed messages.
+
+        If ``accept`` is given, messages whose ``m`` is not in it are dropped. A frame holding a single unaccepted message
+        is recognised from its leading ``m`` key and skipped without being parsed at all.
+        """
+        if accept is not None and data.startswith(FRAME_PREFIX) and data.count(M_KEY) == 1:
+            m = data[len(FRAME_PREFIX):data.find('"', len(FRAME_PREFIX))]
+            if m not in accept:
+                return []
         messages = []
         json_msgs = json.loads(data)
         for json_msg in json_msgs:
-            try:
-                m = json_msg.pop("m")
-                message_type = None
-                for member in MPPMessage.ClientBound:
-                    if member.value[0] == m:
-                        message_type = member
-                        break
-                if message_type is None:
-                    raise ValueError(f"No such message type '{m}'")
-            except (KeyError, ValueError):
-                message_type = MPPMessage.ClientBound.UNKNOWN
-            messages.append(cls(message_type, **json_msg))
+            m = json_msg.pop("m", None)
+            if accept is not None and m not in accept:
+                continue
+            decoder = INBOUND_TYPES.get(m, UnknownMessage)
+            messages.append(decoder(json_msg))
         return messages
 
     @property
     def sender(self) -> Optional[str]:
-        pattern = r"^[0-9a-f]{24}$"
-        return self.search(pattern)
+        decoder = INBOUND_TYPES.get(self.type.m) if isinstance(self.type, MPPMessage.ClientBound) else None
+        return decoder.extract_sender(self.payload) if decoder is not None else None
+
+
+FRAME_PREFIX = '[{"m":"'
+M_KEY = '"m":'
+
+
+class PayloadField:
+    """Read-only view of one payload key, decoded only when a handler accesses it."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: str):
+        self.key = key
+
+    def __get__(self, instance: Optional[MPPMessage], owner: type) -> Any:
+        if instance is None:
+            return self
+        return instance.payload.get(self.key)
+
+
+class InboundMessage(MPPMessage):
+    """
+    Base of the typed client-bound messages.
+
+    Subclasses declare their ``message_type`` and the path to the sender's participant id as ``sender_path``; the
+    required and optional arguments of the message type become ``fields``, read-only attributes over the payload. The
+    payload dict is kept as-is instead of being copied, and fields are only looked up on access.
+    """
+
+    __slots__ = ()
+
+    message_type: MPPMessage.ClientBound = MPPMessage.ClientBound.UNKNOWN
+    sender_path: Optional[Tuple[str, ...]] = None
+    fields: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        arguments = (*cls.message_type.required_args, *cls.message_type.optional_args)
+        # Arguments named like a message attribute, such as the ``sender`` of a direct message, stay payload-only
+        cls.fields = tuple(argument for argument in arguments if not hasattr(InboundMessage, argument))
+        for field in cls.fields:
+            setattr(cls, field, PayloadField(field))
+        INBOUND_TYPES[cls.message_type.m] = cls
+
+    def __init__(self, payload: dict):
+        self.type = self.message_type
+        self.payload = payload
+
+    def log_snapshot(self) -> "InboundMessage":
+        # Decoded payloads are never modified in place, only replaced (the inbound queue does that when merging notes),
+        # so sharing the current payload dict is enough
+        return type(self)(self.payload)
+
+    @property
+    def sender(self) -> Optional[str]:
+        return self.extract_sender(self.payload)
+
+    @classmethod
+    def extract_sender(cls, payload: dict) -> Optional[str]:
+        if cls.sender_path is None:
+            return None
+        value = payload
+        for key in cls.sender_path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value if isinstance(value, str) else None
+
+
+INBOUND_TYPES: Dict[str, type] = {}
+
+
+class ChatMessage(InboundMessage):
+    """MESSAGE"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.MESSAGE
+    sender_path = ("p", "id")
+
+
+class DirectMessage(InboundMessage):
+    """DIRECTMESSAGE"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.DIRECTMESSAGE
+    sender_path = ("sender", "id")
+
+
+class VerifyMessage(InboundMessage):
+    """VERIFY"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.VERIFY
+
+
+class DisconnectMessage(InboundMessage):
+    """DISCONNECT"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.DISCONNECT
+    sender_path = ("p",)
+
+
+class ChatHistoryMessage(InboundMessage):
+    """CHATHISTORY"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.CHATHISTORY
+
+
+class ChannelInfoMessage(InboundMessage):
+    """CHANNELINFO"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.CHANNELINFO
+
+
+class CustomMessage(InboundMessage):
+    """CUSTOM"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.CUSTOM
+    sender_path = ("p",)
+
+
+class ConnectMessage(InboundMessage):
+    """CONNECT"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.CONNECT
+
+
+class RoomListMessage(InboundMessage):
+    """ROOMLIST"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.ROOMLIST
+
+
+class MouseMessage(InboundMessage):
+    """MOUSE"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.MOUSE
+    sender_path = ("id",)
+
+
+class NotesMessage(InboundMessage):
+    """NOTES"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.NOTES
+    sender_path = ("p",)
+
+
+class NotificationMessage(InboundMessage):
+    """NOTIFICATION"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.NOTIFICATION
+
+
+class NoteQuotaMessage(InboundMessage):
+    """NOTEQUOTA"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.NOTEQUOTA
+
+
+class ParticipantMessage(InboundMessage):
+    """PARTICIPANTADDED"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.PARTICIPANTADDED
+    sender_path = ("id",)
+
+
+class PongMessage(InboundMessage):
+    """PONG"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.PONG
+
+
+class UnknownMessage(InboundMessage):
+    """UNKNOWN"""
+    __slots__ = ()
+    message_type = MPPMessage.ClientBound.UNKNOWN
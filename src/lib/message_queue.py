@@ -0,0 +1,157 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Callable, Deque, Hashable
+from src.lib.message import MPPMessage
+
+
+class QueuePolicy:
+    KEEP = "keep"
+    COALESCE = "coalesce"
+    BATCH = "batch"
+
+
+class QueueEntry:
+    __slots__ = ("message", "policy", "key", "alive")
+
+    def __init__(self, message: MPPMessage, policy: str, key: Optional[Hashable]):
+        self.message = message
+        self.policy = policy
+        self.key = key
+        self.alive = True
+
+    def __str__(self):
+        return f"QueueEntry Object: (type={self.message.type.m}, policy={self.policy}, key={self.key}, alive={self.alive})"
+
+
+class MessageQueue:
+    """
+    Bounded FIFO of messages with a policy per message type, taking and returning lists like the batches sent over the wire.
+
+    ``KEEP`` messages (the default) are never dropped. A ``COALESCE`` message replaces the one of the same type and
+    sender that is still queued, so only the latest mouse position per participant waits; a ``BATCH`` message is merged
+    into it, so queued notes of one sender become a single message. Once ``capacity`` messages are queued the oldest
+    coalesced or batched message is shed to make room; if there is none, a coalesced or batched message is shed itself
+    and ``put`` waits for room for a kept one. ``put_nowait`` lets kept messages exceed the capacity instead, for callers
+    that cannot wait. ``on_merge`` and ``on_shed`` are called with the type of every merged and shed message.
+    """
+
+    def __init__(self, capacity: int, policies: Optional[Dict[str, str]] = None, max_batch: int = 64, note_limit: int = 256, on_merge: Optional[Callable[[str], None]] = None, on_shed: Optional[Callable[[str], None]] = None):
+        self.capacity = capacity
+        self.policies = policies or {}
+        self.max_batch = max_batch
+        self.note_limit = note_limit
+        self.on_merge = on_merge
+        self.on_shed = on_shed
+        self.merged = 0
+        self.shed = 0
+
+        self._entries: Deque[QueueEntry] = deque()
+        # Coalesced and batched entries in queue order, the candidates for shedding
+        self._droppable: Deque[QueueEntry] = deque()
+        self._keyed: Dict[Hashable, QueueEntry] = {}
+        self._size = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+
+    def __str__(self):
+        return f"MessageQueue Object: (size={self._size}/{self.capacity}, merged={self.merged}, shed={self.shed})"
+
+    def __len__(self):
+        return self._size
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
+
+    async def put(self, messages: List[MPPMessage]):
+        for message in messages:
+            while not self.offer(message, overflow=False):
+                self._writable.clear()
+                await self._writable.wait()
+
+    def put_nowait(self, messages: List[MPPMessage]):
+        for message in messages:
+            self.offer(message, overflow=True)
+
+    async def get(self) -> List[MPPMessage]:
+        """Wait for messages and return up to ``max_batch`` of them, oldest first."""
+        while not self._size:
+            self._readable.clear()
+            await self._readable.wait()
+        batch = []
+        while self._entries and len(batch) < self.max_batch:
+            entry = self._entries.popleft()
+            if entry.alive:
+                self.release(entry)
+                batch.append(entry.message)
+        while self._droppable and not self._droppable[0].alive:
+            self._droppable.popleft()
+        self._writable.set()
+        return batch
+
+    def offer(self, message: MPPMessage, overflow: bool) -> bool:
+        """Queue, merge or shed ``message``; ``False`` if it has to be kept but there is no room and ``overflow`` is off."""
+        m = message.type.m
+        policy = self.policies.get(m, QueuePolicy.KEEP)
+        key = None
+        if policy != QueuePolicy.KEEP:
+            key = (m, message.sender)
+            entry = self._keyed.get(key)
+            if entry is not None and (policy == QueuePolicy.COALESCE or merge_notes(entry.message, message, self.note_limit)):
+                if policy == QueuePolicy.COALESCE:
+                    entry.message = message
+                self.merged += 1
+                if self.on_merge is not None:
+                    self.on_merge(m)
+                return True
+        if self._size >= self.capacity and not self.evict():
+            if policy != QueuePolicy.KEEP:
+                self.count_shed(m)
+                return True
+            if not overflow:
+                return False
+        entry = QueueEntry(message, policy, key)
+        self._entries.append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+            self._droppable.append(entry)
+        self._size += 1
+        if len(self._entries) > 2 * max(self.capacity, self._size):
+            # Shed entries stay in place until consumed; drop them if nothing is consuming
+            self._entries = deque(entry for entry in self._entries if entry.alive)
+        self._readable.set()
+        return True
+
+    def evict(self) -> bool:
+        while self._droppable:
+            entry = self._droppable.popleft()
+            if entry.alive:
+                self.release(entry)
+                self.count_shed(entry.message.type.m)
+                return True
+        return False
+
+    def release(self, entry: QueueEntry):
+        entry.alive = False
+        self._size -= 1
+        if entry.key is not None and self._keyed.get(entry.key) is entry:
+            del self._keyed[entry.key]
+
+    def count_shed(self, m: str):
+        self.shed += 1
+        if self.on_shed is not None:
+            self.on_shed(m)
+
+
+def merge_notes(first: MPPMessage, second: MPPMessage, limit: int) -> bool:
+    """Append the notes of ``second`` to ``first``, shifting their offsets to ``first``'s time; ``False`` if they cannot be merged."""
+    notes, extra = first.payload.get("n") or [], second.payload.get("n") or []
+    offset = second.payload.get("t", 0) - first.payload.get("t", 0)
+    if offset < 0 or len(notes) + len(extra) > limit:
+        return False
+    if offset:
+        extra = [{**note, "d": note.get("d", 0) + offset} for note in extra]
+    first.payload = {**first.payload, "n": notes + extra}
+    return True
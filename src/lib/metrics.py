@@ -0,0 +1,203 @@
+import asyncio, bisect, math
+from typing import Dict, Tuple, List, Optional, Callable, Sequence
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def __str__(self):
+        return f"Counter Object: (name={self.name}, series={len(self.values)})"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}" for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """A value that can go down; ``track_max`` keeps high-water marks and ``set_function`` samples a callable on export."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, label_names)
+        self.functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def __str__(self):
+        return f"Gauge Object: (name={self.name}, series={len(self.values) + len(self.functions)})"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def track_max(self, value: float, *labels: str):
+        if value > self.values.get(labels, -math.inf):
+            self.values[labels] = value
+
+    def set_function(self, function: Callable[[], float], *labels: str):
+        self.functions[labels] = function
+
+    def get(self, *labels: str) -> float:
+        function = self.functions.get(labels)
+        return function() if function is not None else self.values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        values = {**self.values, **{labels: function() for labels, function in self.functions.items()}}
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}" for labels, value in values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets) + (math.inf,)
+        # Per label set: [bucket counts (non-cumulative)..., sum, count, max]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def __str__(self):
+        return f"Histogram Object: (name={self.name}, series={len(self.series)}, buckets={len(self.buckets)})"
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0, 0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-3] += value
+        series[-2] += 1
+        if value > series[-1]:
+            series[-1] = value
+
+    def count(self, *labels: str) -> int:
+        series = self.series.get(labels)
+        return series[-2] if series is not None else 0
+
+    def mean(self, *labels: str) -> float:
+        series = self.series.get(labels)
+        return series[-3] / series[-2] if series is not None and series[-2] else 0.0
+
+    def maximum(self, *labels: str) -> float:
+        series = self.series.get(labels)
+        return series[-1] if series is not None else 0.0
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (the observed maximum for the overflow bucket)."""
+        series = self.series.get(labels)
+        if series is None or not series[-2]:
+            return 0.0
+        rank = q * series[-2]
+        cumulative = 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            if cumulative >= rank:
+                return bound if bound != math.inf else series[-1]
+        return series[-1]
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_label = 'le="{}"'.format(format_value(bound))
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(series[-3])}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {series[-2]}")
+        return lines
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms, exported in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def __str__(self):
+        return f"Metrics Object: (metrics={len(self.metrics)})"
+
+    def __getitem__(self, name: str):
+        return self.metrics[name]
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint that answers every GET with the current metrics, for Prometheus to scrape."""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9464):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def __str__(self):
+        return f"MetricsServer Object: (host={self.host}, port={self.port}, serving={self.server is not None})"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.startswith(b"GET "):
+                status, body = "200 OK", self.metrics.render().encode()
+            else:
+                status, body = "405 Method Not Allowed", b""
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,205 @@
+import math, struct
+from array import array
+from collections import deque
+from typing import List, Tuple, Union, Iterator, Optional
+from src.lib.exceptions import MidiParseError
+
+DEFAULT_TEMPO = 500000
+LOWEST_KEY = 21
+HIGHEST_KEY = 108
+NOTE_NAMES = ["c", "cs", "d", "ds", "e", "f", "fs", "g", "gs", "a", "as", "b"]
+KEY_NAMES = {key: f"{NOTE_NAMES[key % 12]}{key // 12 - 2}" for key in range(LOWEST_KEY, HIGHEST_KEY + 1)}
+KEY_NUMBERS = {name: key for key, name in KEY_NAMES.items()}
+# Key value marking the tempo changes among the events of a track
+TEMPO_EVENT = -1
+
+
+class Midi:
+    """
+    Compact, time-sorted note events of a parsed MIDI file.
+
+    Events are stored column-wise: ``times`` (milliseconds from the start of the song), ``keys`` (MIDI key numbers)
+    and ``velocities`` (0 for a note release).
+    """
+
+    def __init__(self, times: array, keys: array, velocities: array):
+        self.times = times
+        self.keys = keys
+        self.velocities = velocities
+
+    def __str__(self):
+        return f"Midi Object: (events={len(self)}, duration={self.duration}ms)"
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def duration(self) -> int:
+        return self.times[-1] if len(self.times) > 0 else 0
+
+    @staticmethod
+    def key_name(key: int) -> str:
+        return KEY_NAMES[key]
+
+    @classmethod
+    def from_file(cls, path: str, limits: Optional["MidiLimits"] = None) -> "Midi":
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            return cls.from_bytes(data, limits)
+        except MidiParseError as e:
+            raise MidiParseError(path, e.reason)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray], limits: Optional["MidiLimits"] = None) -> "Midi":
+        times, keys, velocities = array("I"), array("B"), array("B")
+        append_time, append_key, append_velocity = times.append, keys.append, velocities.append
+        for time, key, velocity in cls.iter_events(data, limits):
+            append_time(time)
+            append_key(key)
+            append_velocity(velocity)
+        return cls(times, keys, velocities)
+
+    @classmethod
+    def iter_events(cls, data: Union[bytes, bytearray], limits: Optional["MidiLimits"] = None) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yield the note events of a MIDI file as ``(milliseconds, key, velocity)``, in playback order.
+
+        ``limits`` are enforced while parsing: the track count is checked against the header before any track is read,
+        the event count as events are collected, and duration and note density as events are timed, so a hostile file
+        is rejected as soon as it crosses a limit and never holds more than ``max_events`` events in memory.
+        """
+        limits = limits or UNLIMITED
+        if data[:4] != b"MThd" or len(data) < 14:
+            raise MidiParseError(None, "missing header chunk")
+        header_length, _, track_count, division = struct.unpack(">IHHH", data[4:14])
+        if division == 0 or (division & 0x8000 and division & 0xFF == 0):
+            raise MidiParseError(None, "invalid time division")
+        if track_count > limits.max_tracks:
+            raise MidiParseError(None, f"{track_count} tracks, the limit is {limits.max_tracks}")
+        offset = 8 + header_length
+        notes: List[Tuple[int, int, int]] = []
+        tempos: List[Tuple[int, int]] = []
+        events, max_events = 0, limits.max_events
+        for _ in range(track_count):
+            while offset + 8 <= len(data) and data[offset:offset + 4] != b"MTrk":
+                offset += 8 + struct.unpack(">I", data[offset + 4:offset + 8])[0]
+            if offset + 8 > len(data):
+                break
+            track_length = struct.unpack(">I", data[offset + 4:offset + 8])[0]
+            track_start = offset + 8
+            try:
+                for event in cls.iter_track(data[track_start:track_start + track_length]):
+                    events += 1
+                    if events > max_events:
+                        raise MidiParseError(None, f"more than {max_events} events")
+                    if event[1] == TEMPO_EVENT:
+                        tempos.append((event[0], event[2]))
+                    else:
+                        notes.append(event)
+            except IndexError:
+                raise MidiParseError(None, "truncated track chunk")
+            offset = track_start + track_length
+        notes.sort(key=lambda note: (note[0], note[2] > 0))
+        tempos.sort()
+
+        onsets = deque()
+        max_duration, check_density = limits.max_duration, limits.max_density != math.inf
+        tempo_index, tempo_tick, tempo, elapsed_us = 0, 0, DEFAULT_TEMPO, 0.0
+        for tick, key, velocity in notes:
+            if division & 0x8000:
+                microseconds = tick * 1000000 / ((256 - (division >> 8)) * (division & 0xFF))
+            else:
+                while tempo_index < len(tempos) and tempos[tempo_index][0] <= tick:
+                    elapsed_us += (tempos[tempo_index][0] - tempo_tick) * tempo / division
+                    tempo_tick, tempo = tempos[tempo_index]
+                    tempo_index += 1
+                microseconds = elapsed_us + (tick - tempo_tick) * tempo / division
+            time = round(microseconds / 1000)
+            if time > max_duration:
+                raise MidiParseError(None, f"longer than {limits.max_duration / 1000:.0f} seconds")
+            if velocity and check_density:
+                onsets.append(time)
+                while onsets[0] <= time - 1000:
+                    onsets.popleft()
+                if len(onsets) > limits.max_density:
+                    raise MidiParseError(None, f"more than {limits.max_density} notes within a second at {time / 1000:.1f}s")
+            yield time, key, velocity
+
+    @staticmethod
+    def iter_track(track: bytes) -> Iterator[Tuple[int, int, int]]:
+        """Yield ``(tick, key, velocity)`` for the notes of a track chunk and ``(tick, TEMPO_EVENT, tempo)`` for tempo changes."""
+        position, tick, status = 0, 0, None
+        while position < len(track):
+            delta, position = read_variable_length(track, position)
+            tick += delta
+            if track[position] & 0x80:
+                status = track[position]
+                position += 1
+            elif status is None:
+                raise MidiParseError(None, "data byte without running status")
+            if status == 0xFF:
+                meta_type = track[position]
+                length, position = read_variable_length(track, position + 1)
+                if meta_type == 0x51 and length == 3:
+                    yield tick, TEMPO_EVENT, int.from_bytes(track[position:position + 3], "big")
+                elif meta_type == 0x2F:
+                    break
+                position += length
+                status = None
+            elif status in (0xF0, 0xF7):
+                length, position = read_variable_length(track, position)
+                position += length
+                status = None
+            else:
+                kind = status & 0xF0
+                if kind in (0xC0, 0xD0):
+                    position += 1
+                    continue
+                if position + 2 > len(track):
+                    raise MidiParseError(None, "truncated channel event")
+                key, velocity = track[position], track[position + 1]
+                position += 2
+                if kind in (0x80, 0x90) and LOWEST_KEY <= key <= HIGHEST_KEY:
+                    yield tick, key, velocity if kind == 0x90 else 0
+
+
+class MidiLimits:
+    """
+    Upper bounds on what a parsed MIDI may contain: tracks, events (notes and tempo changes), duration in milliseconds
+    and note density in note presses within any one second.
+    """
+
+    __slots__ = ("max_tracks", "max_events", "max_duration", "max_density")
+
+    def __init__(self, max_tracks: float = math.inf, max_events: float = math.inf, max_duration: float = math.inf, max_density: float = math.inf):
+        self.max_tracks = max_tracks
+        self.max_events = max_events
+        self.max_duration = max_duration
+        self.max_density = max_density
+
+    def __str__(self):
+        return f"MidiLimits Object: (max_tracks={self.max_tracks}, max_events={self.max_events}, max_duration={self.max_duration}ms, max_density={self.max_density}/s)"
+
+    def check(self, midi: Midi):
+        """Check an already parsed MIDI against the event and duration limits, which may have been lowered since it was parsed."""
+        if len(midi) > self.max_events:
+            raise MidiParseError(None, f"more than {self.max_events} events")
+        if midi.duration > self.max_duration:
+            raise MidiParseError(None, f"longer than {self.max_duration / 1000:.0f} seconds")
+
+
+UNLIMITED = MidiLimits()
+
+
+def read_variable_length(data: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    for _ in range(4):
+        if position >= len(data):
+            raise MidiParseError(None, "truncated variable-length quantity")
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, position
+    raise MidiParseError(None, "variable-length quantity exceeds 4 bytes")
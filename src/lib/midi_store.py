@@ -0,0 +1,156 @@
+import hashlib, mmap, os, struct, sys, tempfile
+from array import array
+from typing import Optional
+from src.lib.midi import Midi, MidiLimits, UNLIMITED
+from src.lib.exceptions import MidiParseError
+
+EVENTS_MAGIC = b"MPPE"
+EVENTS_VERSION = 1
+# magic, format version, event count; 16 bytes so the records that follow stay 8-byte aligned
+EVENTS_HEADER = struct.Struct("<4sHxxQ")
+# time in milliseconds, key, velocity, padding
+EVENT_RECORD = struct.Struct("<IBBxx")
+
+
+class MappedMidi(Midi):
+    """
+    A ``Midi`` whose columns are views over a memory-mapped event file instead of arrays in memory.
+
+    The records of an event file are interleaved, so the columns are strided memoryviews: ``times`` reinterprets the
+    records as 32-bit words and takes every other one, ``keys`` and ``velocities`` take one byte out of every eight.
+    Indexing, ``len`` and ``bisect`` work on them like on the arrays of a parsed ``Midi``, and pages are only read from
+    disk once playback reaches them.
+    """
+
+    def __init__(self, mapping: mmap.mmap, count: int):
+        self.mapping = mapping
+        records = memoryview(mapping)[EVENTS_HEADER.size:EVENTS_HEADER.size + count * EVENT_RECORD.size]
+        super().__init__(records.cast("I")[::2], records[4::8], records[5::8])
+
+    def __str__(self):
+        return f"MappedMidi Object: (events={len(self)}, duration={self.duration}ms)"
+
+
+class MidiStore:
+    """
+    Content-addressed storage for MIDI files and their pre-parsed events.
+
+    Files are stored once under the SHA-256 of their contents, however many names point at them, next to an event file
+    holding the parsed notes as fixed-width ``EVENT_RECORD``s. ``open`` maps the event file instead of parsing the MIDI
+    again, so starting a song costs the same for a large file as for a small one. Event files are rebuilt from the
+    stored MIDI whenever they are missing or were written by another format version. Every file is parsed under
+    ``limits``, and mapped event files are checked against them again when opened.
+    """
+
+    def __init__(self, directory: str, limits: Optional[MidiLimits] = None):
+        self.directory = directory
+        self.limits = limits or UNLIMITED
+        self.incoming = os.path.join(directory, "incoming")
+        os.makedirs(self.incoming, exist_ok=True)
+
+    def __str__(self):
+        return f"MidiStore Object: (directory={self.directory}, limits={self.limits})"
+
+    def __contains__(self, sha256: str) -> bool:
+        return os.path.exists(self.midi_path(sha256))
+
+    def midi_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256 + ".mid")
+
+    def events_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256 + ".events")
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def add_file(self, path: str) -> str:
+        """
+        Parse the MIDI at ``path``, move it into the store and return its hash.
+
+        Raises ``MidiParseError`` and leaves the file where it is if it is not a valid MIDI. A file whose contents are
+        already stored is deleted instead of being stored a second time.
+        """
+        midi = Midi.from_file(path, self.limits)
+        sha256 = self.hash_file(path)
+        if sha256 in self:
+            os.remove(path)
+        else:
+            os.replace(path, self.midi_path(sha256))
+        if not os.path.exists(self.events_path(sha256)):
+            self.write_events(sha256, midi)
+        return sha256
+
+    def add_bytes(self, data: bytes) -> str:
+        """Parse and store a MIDI held in memory and return its hash; raises ``MidiParseError`` if it is not valid."""
+        midi = Midi.from_bytes(data, self.limits)
+        sha256 = hashlib.sha256(data).hexdigest()
+        if sha256 not in self:
+            self.write_atomically(self.midi_path(sha256), data)
+        if not os.path.exists(self.events_path(sha256)):
+            self.write_events(sha256, midi)
+        return sha256
+
+    def remove(self, sha256: str):
+        for path in (self.midi_path(sha256), self.events_path(sha256)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def write_events(self, sha256: str, midi: Midi):
+        header = EVENTS_HEADER.pack(EVENTS_MAGIC, EVENTS_VERSION, len(midi))
+        self.write_atomically(self.events_path(sha256), header + b"".join(map(EVENT_RECORD.pack, midi.times, midi.keys, midi.velocities)))
+
+    def write_atomically(self, path: str, data: bytes):
+        """Write through a temporary file renamed over ``path``, so concurrent writers and readers never see a partial file."""
+        descriptor, temporary_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".part", dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def open(self, sha256: str) -> Midi:
+        """The events of a stored MIDI, memory-mapped, building the event file first if it is missing or outdated."""
+        try:
+            midi = self.map_events(sha256)
+            if midi is None:
+                self.write_events(sha256, Midi.from_file(self.midi_path(sha256), self.limits))
+                midi = self.map_events(sha256)
+            self.limits.check(midi)
+        except MidiParseError as e:
+            raise MidiParseError(sha256, e.reason)
+        return midi
+
+    def map_events(self, sha256: str) -> Optional[Midi]:
+        try:
+            file = open(self.events_path(sha256), "rb")
+        except FileNotFoundError:
+            return None
+        with file:
+            header = file.read(EVENTS_HEADER.size)
+            if len(header) < EVENTS_HEADER.size:
+                return None
+            magic, version, count = EVENTS_HEADER.unpack(header)
+            if magic != EVENTS_MAGIC or version != EVENTS_VERSION or os.fstat(file.fileno()).st_size != EVENTS_HEADER.size + count * EVENT_RECORD.size:
+                return None
+            if sys.byteorder != "little":
+                # The mapped views reinterpret the records in native byte order
+                return self.read_events(file.read(), count)
+            return MappedMidi(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), count)
+
+    @staticmethod
+    def read_events(data: bytes, count: int) -> Midi:
+        times, keys, velocities = array("I"), array("B"), array("B")
+        for time, key, velocity in EVENT_RECORD.iter_unpack(data[:count * EVENT_RECORD.size]):
+            times.append(time)
+            keys.append(key)
+            velocities.append(velocity)
+        return Midi(times, keys, velocities)
@@ -0,0 +1,132 @@
+import math
+from array import array
+from itertools import compress, repeat
+from operator import sub, le, and_
+from typing import Dict, List, Iterable, Tuple, Optional
+from src.lib.vector import Vector2D
+from src.lib.participant import Participant
+
+
+class ParticipantStore:
+    """
+    Participant state kept in contiguous arrays indexed by a compact slot per participant.
+
+    Positions, colors and flags live in ``array``/``bytearray`` columns so bulk updates and spatial queries run as
+    chained C-level ``map`` pipelines instead of a Python loop per participant. Slots of departed participants are reused.
+    """
+
+    ACTIVE = 1
+    VANISHED = 2
+    BOT = 4
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.x = array("d")
+        self.y = array("d")
+        self.colors = array("I")
+        self.flags = bytearray()
+        self.active = bytearray()
+
+        self._free: List[int] = []
+
+    def __str__(self):
+        return f"ParticipantStore Object: (participants={len(self)}, capacity={len(self.ids)})"
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self.slots
+
+    def add(self, participant: Participant) -> int:
+        slot = self.slots.get(participant.client_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self.ids[slot] = participant.client_id
+            else:
+                slot = len(self.ids)
+                self.ids.append(participant.client_id)
+                self.x.append(0.0)
+                self.y.append(0.0)
+                self.colors.append(0)
+                self.flags.append(0)
+                self.active.append(0)
+            self.slots[participant.client_id] = slot
+        flags = self.ACTIVE
+        if participant.vanished:
+            flags |= self.VANISHED
+        if participant.tag is not None and participant.tag.text == "BOT":
+            flags |= self.BOT
+        self.x[slot] = participant.pos.x
+        self.y[slot] = participant.pos.y
+        self.colors[slot] = parse_color(participant.color)
+        self.flags[slot] = flags
+        self.active[slot] = 1
+        return slot
+
+    def remove(self, client_id: str):
+        slot = self.slots.pop(client_id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.flags[slot] = 0
+        self.active[slot] = 0
+        self._free.append(slot)
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, client_id: str, x: float, y: float):
+        slot = self.slots.get(client_id)
+        if slot is not None:
+            self.x[slot] = x
+            self.y[slot] = y
+
+    def update_color(self, client_id: str, color: Optional[str]):
+        slot = self.slots.get(client_id)
+        if slot is not None:
+            self.colors[slot] = parse_color(color)
+
+    def update_many(self, updates: Iterable[Tuple[str, float, float]]):
+        """Apply a batch of ``(client_id, x, y)`` mouse updates; unknown participants are ignored."""
+        slots, x, y = self.slots, self.x, self.y
+        for client_id, new_x, new_y in updates:
+            slot = slots.get(client_id)
+            if slot is not None:
+                x[slot] = float(new_x)
+                y[slot] = float(new_y)
+
+    def position(self, client_id: str) -> Optional[Vector2D]:
+        slot = self.slots.get(client_id)
+        return Vector2D(self.x[slot], self.y[slot]) if slot is not None else None
+
+    def color(self, client_id: str) -> Optional[str]:
+        slot = self.slots.get(client_id)
+        return "#{:06x}".format(self.colors[slot]) if slot is not None else None
+
+    def has_flag(self, client_id: str, flag: int) -> bool:
+        slot = self.slots.get(client_id)
+        return slot is not None and bool(self.flags[slot] & flag)
+
+    def distances(self, point: Vector2D) -> Dict[str, float]:
+        """Distance from ``point`` to every participant."""
+        distances = map(math.hypot, map(sub, self.x, repeat(point.x)), map(sub, self.y, repeat(point.y)))
+        return dict(compress(zip(self.ids, distances), self.active))
+
+    def near(self, point: Vector2D, radius: float) -> List[str]:
+        """Client ids of the participants within ``radius`` of ``point``."""
+        distances = map(math.hypot, map(sub, self.x, repeat(point.x)), map(sub, self.y, repeat(point.y)))
+        within = map(and_, map(le, distances, repeat(radius)), self.active)
+        return list(compress(self.ids, within))
+
+    def distances_from(self, client_id: str) -> Dict[str, float]:
+        """Distance from the cursor of ``client_id`` (e.g. the bot itself) to every participant."""
+        origin = self.position(client_id)
+        return self.distances(origin) if origin is not None else {}
+
+
+def parse_color(color: Optional[str]) -> int:
+    """``#rrggbb`` as the integer stored in ``ParticipantStore.colors``, 0 if there is none."""
+    return int(color.lstrip("#"), 16) if color else 0
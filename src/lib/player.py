@@ -0,0 +1,41 @@
+from bisect import bisect_left
+from typing import Optional
+from src.lib.midi import Midi, KEY_NAMES
+from src.lib.message import MPPMessage
+
+
+class MidiPlayer:
+    def __init__(self, midi: Midi, start_time: int, window: int, name: str = None):
+        self.midi = midi
+        self.start_time = start_time
+        self.window = window
+        self.name = name
+        self.cursor = 0
+
+    def __str__(self):
+        return f"MidiPlayer Object: (name={self.name}, start_time={self.start_time}, window={self.window}, cursor={self.cursor}/{len(self.midi)})"
+
+    def advance(self, now: int) -> Optional[MPPMessage]:
+        """Return one NOTES message holding every event due before ``now + window``, or None if nothing is due."""
+        times, keys, velocities = self.midi.times, self.midi.keys, self.midi.velocities
+        horizon = now + self.window - self.start_time
+        end = bisect_left(times, horizon, self.cursor)
+        if end <= self.cursor:
+            return None
+        base = times[self.cursor]
+        notes = []
+        for i in range(self.cursor, end):
+            note = {"n": KEY_NAMES[keys[i]]}
+            if velocities[i]:
+                note["v"] = round(velocities[i] / 127, 3)
+            else:
+                note["s"] = 1
+            if times[i] != base:
+                note["d"] = times[i] - base
+            notes.append(note)
+        self.cursor = end
+        return MPPMessage(MPPMessage.ServerBound.NOTES, t=self.start_time + base, n=notes)
+
+    @property
+    def finished(self) -> bool:
+        return self.cursor >= len(self.midi)
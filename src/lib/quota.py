@@ -0,0 +1,116 @@
+from collections import deque
+from typing import Optional, Set, Tuple
+from src.lib.message import MPPMessage
+
+
+class NoteQuota:
+    """
+    Client-side mirror of the server's note quota.
+
+    The server refills ``allowance`` points every ``TICK_INTERVAL`` milliseconds up to ``max`` and charges one point per
+    note. Tracking the same token bucket locally lets outbound notes be thinned by priority before the server drops them.
+    """
+
+    TICK_INTERVAL = 2000
+    USAGE_HISTORY = 100
+
+    def __init__(self, allowance: int = 200, maximum: int = 600, max_history: int = 3):
+        self.allowance = allowance
+        self.max = maximum
+        self.max_history = max_history
+        self.points = maximum
+        self.history = deque([maximum] * max_history, maxlen=max_history)
+        self.usage = deque(maxlen=self.USAGE_HISTORY)
+        self.last_refill: Optional[int] = None
+        self.spent = 0
+        self.dropped = 0
+
+        self._muted_keys: Set[str] = set()
+
+    def __str__(self):
+        return f"NoteQuota Object: (points={self.points}, allowance={self.allowance}, max={self.max}, max_history={self.max_history})"
+
+    def set_params(self, allowance: int, maximum: int, max_history: int):
+        self.allowance = allowance
+        self.max = maximum
+        self.max_history = max_history
+        self.reset()
+
+    def reset(self):
+        self.points = self.max
+        self.history = deque([self.max] * self.max_history, maxlen=self.max_history)
+        self.usage = deque(maxlen=self.USAGE_HISTORY)
+        self.last_refill = None
+        self._muted_keys.clear()
+
+    def refill(self, now: int):
+        if self.last_refill is None:
+            self.last_refill = now
+            return
+        ticks = (now - self.last_refill) // self.TICK_INTERVAL
+        for _ in range(min(ticks, self.max_history + 1)):
+            self.history.appendleft(self.points)
+            self.points = min(self.points + self.allowance, self.max)
+        self.last_refill += ticks * self.TICK_INTERVAL
+
+    @property
+    def cost(self) -> int:
+        """Points charged per note; the server multiplies it by the allowance once the recent history is exhausted."""
+        return self.allowance if sum(self.history) <= 0 else 1
+
+    def filter(self, message: MPPMessage, now: int) -> Optional[MPPMessage]:
+        """
+        Return the NOTES message thinned to what the quota affords, or None if every note was dropped.
+
+        Releases of keys sounded by earlier messages are kept first, then presses by velocity, each together with its
+        release if that is in the same message. Releasing a key whose press was dropped, in this message or an earlier
+        one, is neither sent nor charged.
+        """
+        self.refill(now)
+        cost = self.cost
+        notes = message.payload["n"]
+        affordable = self.points // cost
+        # Pair every press with the release of its key that follows it in this message
+        paired, pressed, reserved = set(), {}, 0
+        for i, note in enumerate(notes):
+            if not note.get("s"):
+                pressed[note["n"]] = i
+            elif note["n"] in pressed:
+                paired.add(pressed.pop(note["n"]))
+            elif note["n"] not in self._muted_keys:
+                reserved += 1
+        presses = [i for i, note in enumerate(notes) if not note.get("s")]
+        budget = affordable - reserved
+        kept = set()
+        for i in sorted(presses, key=lambda i: -notes[i].get("v", 0.5)):
+            needed = 2 if i in paired else 1
+            if needed <= budget:
+                kept.add(i)
+                budget -= needed
+
+        filtered = []
+        for i, note in enumerate(notes):
+            key = note["n"]
+            if note.get("s"):
+                if key in self._muted_keys:
+                    self._muted_keys.discard(key)
+                elif len(filtered) < affordable:
+                    filtered.append(note)
+            elif i in kept:
+                self._muted_keys.discard(key)
+                filtered.append(note)
+            else:
+                self._muted_keys.add(key)
+                self.dropped += 1
+        self.points -= len(filtered) * cost
+        self.spent += len(filtered)
+        if not filtered:
+            return None
+        return MPPMessage(MPPMessage.ServerBound.NOTES, t=message.payload["t"], n=filtered)
+
+    def report(self) -> Tuple[int, int]:
+        """Publish the notes spent and dropped since the last report and start a new usage period."""
+        usage = (self.spent, self.dropped)
+        self.usage.append(usage)
+        self.spent, self.dropped = 0, 0
+        return usage
@@ -0,0 +1,140 @@
+import heapq, inspect, itertools, math, time
+from typing import Callable, Optional, List, Any
+
+
+class ScheduledTask:
+    CATCH_UP = "catch_up"
+    SKIP = "skip"
+
+    __slots__ = ("due", "sequence", "interval", "callback", "name", "policy", "cancelled")
+
+    def __init__(self, due: float, sequence: int, interval: Optional[float], callback: Callable, name: str, policy: str):
+        self.due = due
+        self.sequence = sequence
+        self.interval = interval
+        self.callback = callback
+        self.name = name
+        self.policy = policy
+        self.cancelled = False
+
+    def __str__(self):
+        return f"ScheduledTask Object: (name={self.name}, due={self.due:.3f}, interval={self.interval}, policy={self.policy}, cancelled={self.cancelled})"
+
+    def __lt__(self, other: "ScheduledTask") -> bool:
+        return (self.due, self.sequence) < (other.due, other.sequence)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Fixed-timestep scheduler for work that runs on the simulation loop.
+
+    Per-tick callbacks run on every tick, in registration order. Periodic tasks and one-shot deadlines sit in a heap keyed
+    by due time and run on the first tick at or after it. A periodic task that fell behind either catches up, running
+    once per missed interval (at most ``max_catch_up`` times per tick), or skips to its next future slot. Once a tick has
+    used ``budget`` seconds, the remaining due tasks are deferred to the next tick; they keep their place in the heap,
+    so a slow task delays the others by at most one tick instead of starving them. Callbacks may be coroutines. A
+    callback that raises is reported to ``on_error`` and the tick goes on with the remaining tasks; a periodic task
+    stays scheduled unless ``on_error`` cancels it.
+    """
+
+    def __init__(self, tps: float = 5.0, budget: Optional[float] = None, max_catch_up: int = 4, clock: Callable[[], float] = time.monotonic, on_error: Optional[Callable[[ScheduledTask, BaseException], Any]] = None):
+        self.tps = tps
+        self.budget = budget
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.on_error = on_error
+        self.ticks = 0
+        self.deferred = 0
+        self.skipped = 0
+        self.failures = 0
+
+        self._heap: List[ScheduledTask] = []
+        self._per_tick: List[ScheduledTask] = []
+        self._sequence = itertools.count()
+
+    def __str__(self):
+        return f"Scheduler Object: (tps={self.tps}, tasks={len(self)}, per_tick={len(self._per_tick)}, ticks={self.ticks}, deferred={self.deferred}, skipped={self.skipped}, failures={self.failures})"
+
+    def __len__(self):
+        return sum(not task.cancelled for task in self._heap)
+
+    @property
+    def interval(self) -> float:
+        return 1 / self.tps
+
+    def each_tick(self, callback: Callable, name: Optional[str] = None) -> ScheduledTask:
+        task = ScheduledTask(0.0, next(self._sequence), 0.0, callback, name or callback.__name__, ScheduledTask.SKIP)
+        self._per_tick.append(task)
+        return task
+
+    def every(self, interval: float, callback: Callable, name: Optional[str] = None, policy: str = ScheduledTask.SKIP, start: Optional[float] = None) -> ScheduledTask:
+        due = start if start is not None else self.clock() + interval
+        return self.push(ScheduledTask(due, next(self._sequence), interval, callback, name or callback.__name__, policy))
+
+    def at(self, deadline: float, callback: Callable, name: Optional[str] = None) -> ScheduledTask:
+        return self.push(ScheduledTask(deadline, next(self._sequence), None, callback, name or callback.__name__, ScheduledTask.SKIP))
+
+    def after(self, delay: float, callback: Callable, name: Optional[str] = None) -> ScheduledTask:
+        return self.at(self.clock() + delay, callback, name)
+
+    def push(self, task: ScheduledTask) -> ScheduledTask:
+        heapq.heappush(self._heap, task)
+        return task
+
+    def clear(self):
+        self._heap.clear()
+        self._per_tick.clear()
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0].due if self._heap else None
+
+    async def tick(self, now: Optional[float] = None):
+        now = self.clock() if now is None else now
+        started = self.clock()
+        self.ticks += 1
+        self._per_tick = [task for task in self._per_tick if not task.cancelled]
+        for task in self._per_tick:
+            await self.run(task)
+        runs = {}
+        while self._heap and self._heap[0].due <= now:
+            if self.budget is not None and self.clock() - started >= self.budget:
+                self.deferred += sum(1 for task in self._heap if task.due <= now and not task.cancelled)
+                break
+            task = heapq.heappop(self._heap)
+            if task.cancelled:
+                continue
+            await self.run(task)
+            if task.interval is None or task.cancelled:
+                continue
+            runs[task.sequence] = runs.get(task.sequence, 0) + 1
+            task.due += task.interval
+            if task.due <= now and (task.policy == ScheduledTask.SKIP or runs[task.sequence] >= self.max_catch_up):
+                missed = math.floor((now - task.due) / task.interval) + 1
+                task.due += missed * task.interval
+                if task.due <= now:
+                    # Rounding can land exactly on ``now``
+                    missed += 1
+                    task.due += task.interval
+                self.skipped += missed
+            heapq.heappush(self._heap, task)
+
+    async def run(self, task: ScheduledTask):
+        try:
+            await self.invoke(task.callback)
+        except Exception as e:
+            # One failing task must not end the tick, and with it the simulation loop
+            self.failures += 1
+            if self.on_error is not None:
+                self.on_error(task, e)
+
+    @staticmethod
+    async def invoke(callback: Callable) -> Any:
+        result = callback()
+        if inspect.isawaitable(result):
+            result = await result
+        return result
@@ -0,0 +1,99 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+from src.lib.midi import Midi, KEY_NUMBERS
+
+
+class PlayerScore:
+    __slots__ = ("client_id", "hits", "extras", "timing", "matched")
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.hits = 0
+        self.extras = 0
+        self.timing = 0.0
+        self.matched: Dict[int, bytearray] = {}
+
+    def __str__(self):
+        return f"PlayerScore Object: (client_id={self.client_id}, hits={self.hits}, extras={self.extras}, timing={self.timing})"
+
+    def misses(self, expected: int) -> int:
+        return max(0, expected - self.hits)
+
+    def accuracy(self, expected: int) -> float:
+        """Timing-weighted share of the expected notes that were hit, in the range 0 to 1."""
+        return self.timing / expected if expected > 0 else 0.0
+
+
+class ScoringEngine:
+    """
+    Matches played notes against the presses of a chart.
+
+    Press times are indexed per key so each incoming note is resolved with a binary search over its key's presses
+    inside the timing window, and each participant only keeps a bitmap of the chart notes they already claimed.
+    """
+
+    def __init__(self, midi: Midi, start_time: int, window: int = 150):
+        self.start_time = start_time
+        self.window = window
+        self.index: Dict[int, array] = {}
+        self.press_times = array("I")
+        self.duration = midi.duration
+        self.players: Dict[str, PlayerScore] = {}
+
+        for time, key, velocity in zip(midi.times, midi.keys, midi.velocities):
+            if velocity:
+                self.index.setdefault(key, array("I")).append(time)
+                self.press_times.append(time)
+
+    def __str__(self):
+        return f"ScoringEngine Object: (notes={len(self.press_times)}, players={len(self.players)}, window={self.window})"
+
+    def judge(self, client_id: str, key: int, time: int) -> Optional[int]:
+        """Match a press at server ``time`` and return its timing error in milliseconds, or None if nothing matched."""
+        player = self.players.get(client_id)
+        if player is None:
+            player = self.players[client_id] = PlayerScore(client_id)
+        times = self.index.get(key)
+        if times is None:
+            player.extras += 1
+            return None
+        chart_time = time - self.start_time
+        low = bisect_left(times, chart_time - self.window)
+        high = bisect_right(times, chart_time + self.window, low)
+        matched = player.matched.get(key)
+        best = None
+        for i in range(low, high):
+            if matched is not None and matched[i]:
+                continue
+            if best is None or abs(times[i] - chart_time) < abs(times[best] - chart_time):
+                best = i
+        if best is None:
+            player.extras += 1
+            return None
+        if matched is None:
+            matched = player.matched[key] = bytearray(len(times))
+        matched[best] = 1
+        error = times[best] - chart_time
+        player.hits += 1
+        player.timing += 1 - abs(error) / (self.window + 1)
+        return error
+
+    def handle_notes(self, client_id: str, base_time: int, notes: List[dict]):
+        for note in notes:
+            if note.get("s"):
+                continue
+            key = KEY_NUMBERS.get(note.get("n"))
+            if key is not None:
+                self.judge(client_id, key, base_time + int(note.get("d", 0)))
+
+    def expected(self, now: int) -> int:
+        """Number of chart presses whose timing window has already closed at server time ``now``."""
+        return bisect_right(self.press_times, now - self.start_time - self.window)
+
+    def is_over(self, now: int) -> bool:
+        return now - self.start_time > self.duration + self.window
+
+    def results(self, now: int) -> List[PlayerScore]:
+        expected = self.expected(now)
+        return sorted(self.players.values(), key=lambda player: player.accuracy(expected), reverse=True)
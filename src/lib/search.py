@@ -0,0 +1,152 @@
+import re, threading
+from collections import defaultdict
+from typing import Dict, Set, List, Iterable, Tuple
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (edits plus adjacent transpositions), or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class SearchIndex:
+    """
+    Incremental inverted index over short documents (e.g. MIDI filenames) with typo-tolerant, ranked lookups.
+
+    Documents are split into casefolded word tokens. Each token maps to the documents containing it, and each trigram of
+    a token maps to the tokens containing it, so a query term only ever scores the handful of tokens that share a
+    trigram with it instead of every document. Terms match tokens exactly, as a prefix, as a substring, within a small
+    edit distance of the token or its prefix, or by trigram similarity; every query term has to match for a document
+    to be returned.
+    """
+
+    EXACT_SCORE = 1.0
+    PREFIX_SCORE = 0.9
+    SUBSTRING_SCORE = 0.7
+
+    def __init__(self, threshold: float = 0.45):
+        self.threshold = threshold
+        self.documents: Dict[str, Tuple[str, ...]] = {}
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        self.trigram_postings: Dict[str, Set[str]] = defaultdict(set)
+
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"SearchIndex Object: (documents={len(self.documents)}, tokens={len(self.postings)}, trigrams={len(self.trigram_postings)})"
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, document: str) -> bool:
+        return document in self.documents
+
+    def add(self, document: str):
+        with self._lock:
+            if document in self.documents:
+                return
+            tokens = tuple(tokenize(document))
+            self.documents[document] = tokens
+            for token in tokens:
+                if token not in self.postings:
+                    for trigram in trigrams(token):
+                        self.trigram_postings[trigram].add(token)
+                self.postings[token].add(document)
+
+    def add_many(self, documents: Iterable[str]):
+        for document in documents:
+            self.add(document)
+
+    def remove(self, document: str):
+        with self._lock:
+            tokens = self.documents.pop(document, None)
+            if tokens is None:
+                return
+            for token in set(tokens):
+                documents = self.postings[token]
+                documents.discard(document)
+                if documents:
+                    continue
+                del self.postings[token]
+                for trigram in trigrams(token):
+                    tokens_with_trigram = self.trigram_postings[trigram]
+                    tokens_with_trigram.discard(token)
+                    if not tokens_with_trigram:
+                        del self.trigram_postings[trigram]
+
+    def rename(self, old: str, new: str):
+        self.remove(old)
+        self.add(new)
+
+    def match_term(self, term: str) -> Dict[str, float]:
+        """Score every indexed token that ``term`` plausibly refers to."""
+        term_trigrams = trigrams(term)
+        shared = defaultdict(int)
+        for trigram in term_trigrams:
+            for token in self.trigram_postings.get(trigram, ()):
+                shared[token] += 1
+        matches = {}
+        for token, count in shared.items():
+            if token == term:
+                score = self.EXACT_SCORE
+            elif token.startswith(term):
+                score = self.PREFIX_SCORE
+            elif term in token:
+                score = self.SUBSTRING_SCORE
+            else:
+                similarity = 2 * count / (len(term_trigrams) + len(token) + 1)
+                typos = 1 if len(term) <= 5 else 2
+                if count >= 2 and len(term) >= 4:
+                    distance = min(edit_distance(term, token, typos), edit_distance(term, token[:len(term)], typos))
+                    if distance <= typos:
+                        similarity = max(similarity, 1 - distance / len(term))
+                if similarity < self.threshold:
+                    continue
+                score = similarity * self.SUBSTRING_SCORE
+            matches[token] = score
+        return matches
+
+    def search(self, query: str, limit: int = None) -> List[str]:
+        """Documents matching every term of ``query``, best match first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for token, score in self.match_term(term).items():
+                    for document in self.postings[token]:
+                        if score > term_scores[document]:
+                            term_scores[document] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {document: scores[document] + score for document, score in term_scores.items() if document in scores}
+                if not scores:
+                    return []
+            # Prefer documents where the query covers more of the name, then shorter and alphabetically earlier names
+            ranked = sorted(scores, key=lambda document: (-scores[document] - len(terms) / (len(self.documents[document]) + len(terms)), len(document), document))
+        return ranked[:limit] if limit is not None else ranked
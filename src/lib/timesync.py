@@ -0,0 +1,81 @@
+import time
+from collections import deque
+from statistics import median
+from typing import Optional, Dict
+
+
+class TimeSync:
+    """
+    Server clock estimator built on PING/PONG round trips.
+
+    Each sample yields a round-trip time and a clock offset assuming a symmetric path. The offset of the fastest
+    sample in the window is used, since queueing delay only ever makes a round trip longer and its midpoint less reliable.
+    """
+
+    def __init__(self, window: int = 16, warmup_samples: int = 8, fast_interval: float = 1.0, slow_interval: float = 20.0):
+        self.window = window
+        self.warmup_samples = warmup_samples
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.samples = deque(maxlen=window)
+        self.sample_count = 0
+
+    def __str__(self):
+        return f"TimeSync Object: (offset={self.offset}, rtt={self.rtt}, samples={len(self.samples)})"
+
+    def reset(self):
+        self.samples.clear()
+        self.sample_count = 0
+
+    def add_sample(self, sent: int, server_time: int, received: int):
+        """Record a PONG: ``sent`` is the echoed local PING time, ``server_time`` the server's ``t``, ``received`` the local arrival time."""
+        rtt = received - sent
+        if rtt < 0:
+            return
+        offset = server_time + rtt / 2 - received
+        self.samples.append((rtt, offset))
+        self.sample_count += 1
+
+    @property
+    def is_synced(self) -> bool:
+        return len(self.samples) > 0
+
+    @property
+    def is_stable(self) -> bool:
+        return self.sample_count >= self.warmup_samples
+
+    @property
+    def probe_interval(self) -> float:
+        return self.slow_interval if self.is_stable else self.fast_interval
+
+    @property
+    def offset(self) -> float:
+        if not self.samples:
+            return 0.0
+        return min(self.samples)[1]
+
+    @property
+    def rtt(self) -> Optional[float]:
+        return median(rtt for rtt, _ in self.samples) if self.samples else None
+
+    @property
+    def rtt_distribution(self) -> Dict[str, float]:
+        rtts = sorted(rtt for rtt, _ in self.samples)
+        if not rtts:
+            return {}
+        return {
+            "min": rtts[0],
+            "median": median(rtts),
+            "p90": rtts[min(len(rtts) - 1, int(len(rtts) * 0.9))],
+            "max": rtts[-1],
+            "jitter": rtts[-1] - rtts[0]
+        }
+
+    def server_now(self) -> int:
+        return round(time.time() * 1000 + self.offset)
+
+    def to_server(self, local_time: int) -> int:
+        return round(local_time + self.offset)
+
+    def to_local(self, server_time: int) -> int:
+        return round(server_time - self.offset)
@@ -0,0 +1,188 @@
+import sqlite3, threading
+from typing import Dict, Tuple, Optional, Any, List
+from src.lib.logger import Logger
+from src.lib.debug import Debug
+from src.lib.connection_pool import ConnectionPool
+from src.lib.exceptions import WriteBehindError
+
+
+def upsert_statement(table: str, key_columns: Tuple[str, ...], values: dict, update_columns: Tuple[str, ...]) -> Tuple[str, list]:
+    assignments = ", ".join([f"{column} = excluded.{column}" for column in update_columns])
+    command = f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join(['?'] * len(values))}) ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {assignments}"
+    return command, list(values.values())
+
+
+class PendingWrite:
+    INSERT = "insert"
+    UPDATE = "update"
+    UPSERT = "upsert"
+
+    __slots__ = ("kind", "table", "key_column", "key", "values", "update_columns")
+
+    def __init__(self, kind: str, table: str, key_column: Any, key: Any, values: dict, update_columns: Tuple[str, ...] = ()):
+        self.kind = kind
+        self.table = table
+        self.key_column = key_column
+        self.key = key
+        self.values = values
+        self.update_columns = update_columns
+
+    def __str__(self):
+        return f"PendingWrite Object: (kind={self.kind}, table={self.table}, {self.key_column}={self.key}, values={self.values})"
+
+
+class WriteBehindBuffer:
+    """
+    Queues row writes and flushes them from a dedicated thread in batched transactions.
+
+    Writes are merged per ``(table, key)``: later updates overwrite earlier column values, and updates to a row whose
+    insert is still pending are folded into that insert. A flush is triggered once ``batch_size`` rows are pending or
+    ``interval`` seconds have passed, and ``close`` flushes whatever is left before the thread exits. If a batch fails,
+    its rows are retried one at a time so one bad row does not take the others with it; the rows that still fail are
+    logged and raised from the next ``flush`` as a ``WriteBehindError``.
+    """
+
+    def __init__(self, pool: ConnectionPool, logger: Logger, batch_size: int = 100, interval: float = 1.0):
+        self.pool = pool
+        self.logger = logger
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending: Dict[Tuple[str, Any], PendingWrite] = {}
+        self.flushing: Dict[Tuple[str, Any], PendingWrite] = {}
+        self.failed: List[Tuple[PendingWrite, str]] = []
+        self.is_running = True
+
+        self._condition = threading.Condition()
+        self._flush_requested = False
+        self._thread = threading.Thread(target=self.run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._condition:
+            return len(self.pending) + len(self.flushing)
+
+    def insert(self, table: str, key_column: str, values: dict):
+        self.enqueue(PendingWrite(PendingWrite.INSERT, table, key_column, values[key_column], dict(values)))
+
+    def update(self, table: str, key_column: str, key: Any, values: dict):
+        self.enqueue(PendingWrite(PendingWrite.UPDATE, table, key_column, key, dict(values)))
+
+    def upsert(self, table: str, key_columns: Tuple[str, ...], values: dict, update_columns: Tuple[str, ...]):
+        """Insert a row, or only set ``update_columns`` if a row with the same ``key_columns`` already exists."""
+        key = tuple(values[column] for column in key_columns)
+        self.enqueue(PendingWrite(PendingWrite.UPSERT, table, key_columns, key, dict(values), update_columns))
+
+    def enqueue(self, write: PendingWrite):
+        with self._condition:
+            queued = self.pending.get((write.table, write.key))
+            if queued is not None and queued.kind == PendingWrite.UPSERT:
+                queued.values.update({column: write.values[column] for column in write.update_columns if column in write.values})
+            elif queued is not None and write.kind == PendingWrite.UPDATE:
+                queued.values.update(write.values)
+            else:
+                # An insert after a queued update still has to create the row; the update alone would match nothing
+                self.pending[(write.table, write.key)] = write
+            if len(self.pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def lookup(self, table: str, key: Any) -> Optional[PendingWrite]:
+        """Merge the in-flight and pending writes for one row, so reads can see writes that are not committed yet."""
+        with self._condition:
+            merged = None
+            for writes in (self.flushing, self.pending):
+                write = writes.get((table, key))
+                if write is None:
+                    continue
+                if merged is None:
+                    merged = PendingWrite(write.kind, table, write.key_column, key, dict(write.values), write.update_columns)
+                else:
+                    merged.values.update(write.values)
+            return merged
+
+    def pending_keys(self, table: str, kind: str = PendingWrite.INSERT) -> list:
+        with self._condition:
+            return [write.key for writes in (self.flushing, self.pending) for write in writes.values() if write.table == table and write.kind == kind]
+
+    def flush(self, raise_failures: bool = True):
+        """
+        Block until everything queued so far has been written; raises ``WriteBehindError`` if the flusher thread died.
+
+        Rows that failed since the last flush are raised as a ``WriteBehindError`` too, unless ``raise_failures`` is off
+        as for reads that only need to see the queued writes; they stay recorded for the next flush that raises them.
+        """
+        with self._condition:
+            if not self._thread.is_alive() and not self.is_running:
+                self.write_batch(self.swap())
+                self.flushing = {}
+            else:
+                self._flush_requested = True
+                self._condition.notify_all()
+                while not self._condition.wait_for(lambda: not self.pending and not self.flushing, timeout=self.interval):
+                    if not self._thread.is_alive():
+                        raise WriteBehindError(f"the flusher thread died with {len(self.pending) + len(self.flushing)} write(s) queued")
+            if not raise_failures:
+                return
+            failed, self.failed = self.failed, []
+        if failed:
+            raise WriteBehindError(f"{len(failed)} row(s) could not be written ({failed[0][1]})", [write for write, _ in failed])
+
+    def close(self):
+        with self._condition:
+            self.is_running = False
+            self._condition.notify_all()
+        self._thread.join()
+
+    def swap(self) -> Dict[Tuple[str, Any], PendingWrite]:
+        self.flushing, self.pending = self.pending, {}
+        self._flush_requested = False
+        return self.flushing
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self.is_running or self._flush_requested or len(self.pending) >= self.batch_size, timeout=self.interval)
+                batch = self.swap()
+                stopping = not self.is_running
+            if batch:
+                self.write_batch(batch)
+            with self._condition:
+                self.flushing = {}
+                self._condition.notify_all()
+            if stopping:
+                break
+
+    def write_batch(self, batch: Dict[Tuple[str, Any], PendingWrite]):
+        connection = self.pool.writer
+        try:
+            with self.pool.writer_lock, connection:
+                for write in batch.values():
+                    self.execute(connection, write)
+            self.logger.log(Debug.DATABASE, "Flushed %s queued write(s)", len(batch))
+        except sqlite3.Error as e:
+            self.logger.log(Debug.ERROR, "Failed to flush %s queued write(s) (%s), retrying them one at a time", len(batch), e)
+            self.write_rows(batch)
+
+    def write_rows(self, batch: Dict[Tuple[str, Any], PendingWrite]):
+        connection = self.pool.writer
+        failed = []
+        for write in batch.values():
+            try:
+                with self.pool.writer_lock, connection:
+                    self.execute(connection, write)
+            except sqlite3.Error as e:
+                failed.append((write, str(e)))
+                self.logger.log(Debug.ERROR, "Failed to write queued %s into %s (%s=%r): %s", write.kind, write.table, write.key_column, write.key, e)
+        with self._condition:
+            self.failed.extend(failed)
+        self.logger.log(Debug.DATABASE, "Flushed %s of %s queued write(s) one at a time", len(batch) - len(failed), len(batch))
+
+    @staticmethod
+    def execute(connection: sqlite3.Connection, write: PendingWrite):
+        if write.kind == PendingWrite.INSERT:
+            command = f"INSERT INTO {write.table} ({', '.join(write.values)}) VALUES ({', '.join(['?'] * len(write.values))})"
+            connection.execute(command, list(write.values.values()))
+        elif write.kind == PendingWrite.UPSERT:
+            connection.execute(*upsert_statement(write.table, write.key_column, write.values, write.update_columns))
+        else:
+            command = f"UPDATE {write.table} SET {', '.join([f'{column} = ?' for column in write.values])} WHERE {write.key_column} = ?"
+            connection.execute(command, list(write.values.values()) + [write.key])
@@ -1,5 +1,5 @@
-from enum import Enum
-from typing import List
+from enum import Enum, IntFlag
+from typing import List, Iterable
 from config import Config, RolesType
 
 config = Config()
@@ -57,6 +57,17 @@ class Role:
                 name, description = key, value
         return cls(name, description)
 
+    @classmethod
+    def from_mask(cls, mask: int) -> List["Role"]:
+        return [cls(name, cls.__members__[name]) for name in cls.__members__ if mask & RoleFlag[name]]
+
+    @classmethod
+    def mask_from_names(cls, role_names: Iterable[str]) -> "RoleFlag":
+        mask = RoleFlag(0)
+        for role_name in role_names:
+            mask |= cls.from_name(role_name.strip()).flag
+        return mask
+
     @classmethod
     def get_commands(cls) -> List["Role"]:
         return [member for member in cls.get_members() if member._name != "UNKNOWN"]
@@ -68,3 +79,11 @@ class Role:
     @property
     def name(self) -> str:
         return self._name.lower()
+
+    @property
+    def flag(self) -> "RoleFlag":
+        return RoleFlag[self._name]
+
+
+# UNKNOWN takes the lowest bit so appending roles to the enum never moves the bits already stored in the database
+RoleFlag = IntFlag("RoleFlag", ["UNKNOWN", *Role.roles.__members__])
@@ -1,5 +1,4 @@
 import re
-from typing import Optional
 
 URL_PATTERN = re.compile(
     r'^(https?|ftp)://'
@@ -15,12 +14,3 @@ URL_PATTERN = re.compile(
 
 def is_valid_url(url: str) -> bool:
     return bool(re.match(URL_PATTERN, url))
-
-
-def search_engine(query: str, searchable_data: list[str]) -> Optional[list[str]]:
-    search_terms = query.split()
-    results = []
-    for item in searchable_data:
-        if all(re.search(re.compile(term, re.IGNORECASE), item) for term in search_terms):
-            results.append(item)
-    return results if results else None
@@ -50,7 +50,26 @@ def format_foreign_key_def(child_key: str, parent_table: str, parent_key: str, *
     return "FOREIGN KEY ({0}) REFERENCES {1} ({2}) {3}".format(child_key, parent_table, parent_key, action_clause).rstrip()
 
 
-def datetime_to_string(datetime_object: datetime = datetime.utcnow()) -> str:
+def get_index_defs(table_name: str, indexes: list) -> list:
+    index_defs = []
+    for index in indexes:
+        index_defs.append(format_index_def(table_name, **index))
+    return index_defs
+
+
+def format_index_def(table_name: str, index_name: str, columns: list, **kwargs) -> str:
+    unique = "UNIQUE " if kwargs.get("unique") else ""
+    return "CREATE {0}INDEX IF NOT EXISTS {1} ON {2} ({3})".format(unique, index_name, table_name, ", ".join(columns))
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every string that starts with ``prefix``, for index-friendly range scans."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def datetime_to_string(datetime_object: datetime = None) -> str:
+    if datetime_object is None:
+        datetime_object = datetime.utcnow()
     return datetime_object.strftime("%Y-%m-%d %H:%M:%S")
 
 
@@ -0,0 +1,111 @@
+import asyncio, os, socket, tempfile, threading, time, unittest
+from src.lib.downloader import Downloader
+from src.lib.exceptions import DownloadError
+
+
+class SlowServer:
+    """Local HTTP server that answers ``/fast`` at once and trickles the body of every other path a byte at a time."""
+
+    def __init__(self, close_delimited: bool, interval: float = 0.2):
+        self.close_delimited = close_delimited
+        self.interval = interval
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.listener.getsockname()[1]}"
+        self.is_running = True
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def close(self):
+        self.is_running = False
+        self.listener.close()
+
+    def serve(self):
+        while self.is_running:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection: socket.socket):
+        with connection:
+            request = connection.recv(4096)
+            if self.close_delimited:
+                # HTTP/1.0 without a length: the body ends when the connection is closed
+                connection.sendall(b"HTTP/1.0 200 OK\r\nConnection: close\r\n\r\n")
+            else:
+                connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n")
+            if request.startswith(b"GET /fast"):
+                connection.sendall(b"MThd")
+                return
+            try:
+                while self.is_running:
+                    connection.sendall(b"x")
+                    time.sleep(self.interval)
+            except OSError:
+                pass
+
+
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def download(self, server: SlowServer, path: str, timeout: float) -> float:
+        downloader = Downloader(self.directory, 10 ** 6, timeout)
+        started = time.monotonic()
+        with self.assertRaises(DownloadError) as context:
+            asyncio.run(downloader.download(server.url + path, "song.mid"))
+        self.assertIn("timed out", context.exception.reason)
+        return time.monotonic() - started
+
+    def test_deadline_with_content_length(self):
+        server = SlowServer(close_delimited=False)
+        try:
+            self.assertLess(self.download(server, "/slow", 1.0), 3.0)
+        finally:
+            server.close()
+
+    def test_deadline_with_close_delimited_body(self):
+        server = SlowServer(close_delimited=True)
+        try:
+            self.assertLess(self.download(server, "/slow", 1.0), 3.0)
+        finally:
+            server.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_cancel_stops_the_worker(self):
+        server = SlowServer(close_delimited=True)
+
+        async def cancel():
+            downloader = Downloader(self.directory, 10 ** 6, 30.0)
+            task = asyncio.create_task(downloader.download(server.url + "/slow", "song.mid"))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        try:
+            asyncio.run(cancel())
+            # asyncio.run waits for the worker thread, so getting here at all means it stopped
+        finally:
+            server.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_concurrent_downloads_get_their_own_files(self):
+        server = SlowServer(close_delimited=True)
+
+        async def both():
+            downloader = Downloader(self.directory, 10 ** 6, 5.0)
+            return await asyncio.gather(*[downloader.download(server.url + "/fast", "song.mid") for _ in range(2)])
+
+        try:
+            first, second = asyncio.run(both())
+        finally:
+            server.close()
+        self.assertNotEqual(first, second)
+        for path in (first, second):
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), b"MThd")
+
+
+if __name__ == "__main__":
+    unittest.main()